@@ -0,0 +1,190 @@
+"""
+Throughput benchmark for notion-py's markdown converters (`markdown_to_notion`,
+`notion_to_markdown` and `cleanup_dashes`) over large synthetic inputs.
+
+    python benchmarks/bench_markdown.py --sizes 10000 40000 160000 640000
+
+Each converter is timed at every size; if its time grows faster than
+size ** `--max-exponent` over the sizes, the converter has gone superlinear
+and the benchmark exits with a non-zero status.
+
+The markdown is split into paragraphs of about `PARAGRAPH_SIZE` characters:
+commonmark's inline parser copies the rest of a paragraph for every token it
+matches, so `markdown_to_notion` is quadratic in the length of a single
+paragraph, and only linear in the number of them.
+"""
+
+import argparse
+import gc
+import json
+import math
+import random
+import sys
+import time
+
+from notion.markdown import cleanup_dashes, markdown_to_notion, notion_to_markdown
+
+SIZES = (10_000, 40_000, 160_000, 640_000)
+
+PARAGRAPH_SIZE = 2_000
+
+ROUNDS = 5
+
+WORDS = "notion markdown block page title rich text equation dash-separated".split()
+
+STYLES = [[], [["b"]], [["i"]], [["s"]], [["c"]], [["b"], ["i"]], [["a", "#x-y"]]]
+
+
+def generate_markdown(size, rng):
+    """
+    about `size` characters of inline markdown, with strikethrough, latex and
+    dashes, in paragraphs of about `PARAGRAPH_SIZE` characters
+    """
+    chunks, length, paragraph = [], 0, 0
+    while length < size:
+        if length - paragraph >= PARAGRAPH_SIZE:
+            chunks.append("\n\n")
+            paragraph = length
+        kind = rng.random()
+        word = rng.choice(WORDS)
+        if kind < 0.1:
+            chunk = "~~{}~~".format(word)
+        elif kind < 0.15:
+            chunk = "$$x_{} - y$$".format(rng.randint(0, 9))
+        elif kind < 0.2:
+            chunk = "**{}**".format(word)
+        elif kind < 0.25:
+            chunk = "$$ {}".format(word)  # never closed on its line
+        elif kind < 0.3:
+            chunk = "-\n"
+        else:
+            chunk = word
+        chunks.append(chunk)
+        length += len(chunk) + 1
+    return " ".join(chunks)
+
+
+def generate_notion(size, rng):
+    """rich text segments totalling about `size` characters"""
+    segments, length = [], 0
+    while length < size:
+        text = " " * rng.randint(0, 2) + rng.choice(WORDS) + " " * rng.randint(0, 2)
+        style = rng.choice(STYLES)
+        segments.append([text, style] if style else [text])
+        length += len(text)
+    return segments
+
+
+def _time(fn, arg, min_time=0.05):
+    """the best of as many runs as fit in `min_time` seconds (at least one)"""
+    best, total = float("inf"), 0.0
+    while total < min_time:
+        start = time.perf_counter()
+        fn(arg)
+        seconds = time.perf_counter() - start
+        best, total = min(best, seconds), total + seconds
+    return best
+
+
+def benchmark(sizes, seed=0, rounds=ROUNDS):
+    """
+    Time each converter at each size, as the best of `rounds` rounds that
+    each time every converter at every size, so a slow or fast spell of the
+    machine affects all sizes alike.
+    """
+    rng = random.Random(seed)
+    cases = []
+    for size in sizes:
+        markdown = generate_markdown(size, rng)
+        notion = generate_notion(size, rng)
+        dashed = [[s[0].replace("-", "⸻"), *s[1:]] for s in notion]
+        cases += [
+            ("markdown_to_notion", size, markdown_to_notion, markdown),
+            ("notion_to_markdown", size, notion_to_markdown, notion),
+            # cleanup_dashes works in place, so give each run its own copy
+            (
+                "cleanup_dashes",
+                size,
+                lambda d: cleanup_dashes(json.loads(d)),
+                json.dumps(dashed),
+            ),
+        ]
+    best = [float("inf")] * len(cases)
+    # like timeit, leave the garbage collector out of it: its full collections
+    # grow with the heap, and make the timings of larger inputs noisy
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            for i, (_, _, fn, arg) in enumerate(cases):
+                best[i] = min(best[i], _time(fn, arg))
+    finally:
+        gc.enable()
+    return [
+        {
+            "converter": name,
+            "size": size,
+            "seconds": seconds,
+            "mb_per_second": size / seconds / 1e6,
+        }
+        for (name, size, _, _), seconds in zip(cases, best)
+    ]
+
+
+def superlinear(results, max_exponent):
+    """
+    (converter, exponent) for each converter whose time grows faster than
+    size ** `max_exponent`, with the exponent fitted over all sizes (a log-log
+    least squares slope: 1 is linear, 2 quadratic), so one noisy timing can't
+    fail the benchmark on its own
+    """
+    slow = []
+    by_converter = {}
+    for result in results:
+        by_converter.setdefault(result["converter"], []).append(result)
+    for name, runs in by_converter.items():
+        if len(runs) < 2:
+            continue
+        xs = [math.log(r["size"]) for r in runs]
+        ys = [math.log(r["seconds"]) for r in runs]
+        mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+        exponent = sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / sum(
+            (x - mx) ** 2 for x in xs
+        )
+        if exponent > max_exponent:
+            slow.append((name, exponent))
+    return slow
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument(
+        "--max-exponent",
+        type=float,
+        default=1.3,
+        help="fail if time grows faster than the input size to this power",
+    )
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = benchmark(sorted(args.sizes), args.seed, args.rounds)
+    for result in results:
+        print(
+            "{converter:>20} {size:>9} chars: {seconds:8.4f}s "
+            "{mb_per_second:8.2f} MB/s".format(**result)
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    slow = superlinear(results, args.max_exponent)
+    for name, exponent in slow:
+        print(
+            "{} is superlinear: its time grows as size ** {:.2f}".format(
+                name, exponent
+            ),
+            file=sys.stderr,
+        )
+    sys.exit(1 if slow else 0)
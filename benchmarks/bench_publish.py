@@ -0,0 +1,205 @@
+"""
+End-to-end publish benchmark: generates synthetic markdown trees of several
+sizes and publishes them with `notionpub.main._upload` against a local
+FakeNotionServer, reporting requests issued, wall time, bytes sent and peak RSS
+for a cold publish, a no-op re-run and a single-file edit.
+
+    python benchmarks/bench_publish.py --sizes 10 100 --latency 0.02
+
+Each publish runs in its own process, so peak RSS is per run.
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_notion import FakeNotionServer  # noqa: E402
+
+SIZES = (10, 100, 500)
+SCENARIOS = ("cold", "noop", "edit")
+
+WORDS = (
+    "notion markdown publish block page paragraph heading list item tree "
+    "request latency batch index manifest cache image upload directory"
+).split()
+
+
+def generate_tree(root, n_files, blocks_per_file=60, files_per_dir=20, seed=0):
+    """write `n_files` markdown files under `root`/docs, and a config for them"""
+    rng = random.Random(seed)
+    root = pathlib.Path(root)
+    for i in range(n_files):
+        path = (
+            root
+            / "docs"
+            / "section{}".format(i // files_per_dir)
+            / "doc{}.md".format(i)
+        )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(_document(rng, i, blocks_per_file))
+    (root / "notionpub.yaml").write_text(
+        "root_page_id: {}\npaths:\n  - docs/**\n".format(
+            FakeNotionServer().root_page_id
+        )
+    )
+
+
+def _document(rng, n, blocks):
+    def sentence(styled=False):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(5, 20))]
+        # md2notion can't render inline styles inside list items
+        if styled and rng.random() < 0.3:
+            i = rng.randrange(len(words))
+            words[i] = rng.choice(["**{}**", "*{}*", "`{}`"]).format(words[i])
+        return " ".join(words).capitalize() + "."
+
+    lines = ["# Document {}".format(n), ""]
+    while len(lines) < blocks:
+        kind = rng.random()
+        if kind < 0.1:
+            lines += ["## " + sentence()[:-1], ""]
+        elif kind < 0.3:
+            for _ in range(rng.randint(2, 6)):
+                lines.append("- " + sentence())
+                if rng.random() < 0.3:
+                    lines.append("  - " + sentence())
+            lines.append("")
+        elif kind < 0.4:
+            for i in range(rng.randint(2, 5)):
+                lines.append("{}. {}".format(i + 1, sentence()))
+            lines.append("")
+        else:
+            lines += [" ".join(sentence(True) for _ in range(rng.randint(1, 4))), ""]
+    return "\n".join(lines)
+
+
+def run_publish(directory, base_url, rate, concurrency):
+    """publish `directory` in a child process, returning its wall time and peak RSS"""
+    out = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--publish",
+            directory,
+            "--base-url",
+            base_url,
+            "--rate",
+            str(rate),
+            "--concurrency",
+            str(concurrency),
+        ],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _publish(directory, base_url, rate, concurrency):
+    from notionpub import config, main, notion
+    from notionpub.ratelimit import TokenBucket
+
+    with open(os.path.join(directory, "notionpub.yaml")) as f:
+        cfg = config.load_config(f)
+    client = notion.NotionClient(
+        "secret_benchmark",
+        limiter=TokenBucket(rate=rate, burst=max(rate, 1)),
+        base_url=base_url,
+    )
+    start = time.perf_counter()
+    main._upload(directory, cfg, concurrency=concurrency, client=client)
+    wall = time.perf_counter() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        rss *= 1024  # ru_maxrss is in KiB on linux, bytes on macOS
+    print(json.dumps({"wall_time": wall, "peak_rss": rss}))
+
+
+def benchmark(sizes, latency, rate_limit_every, rate, concurrency):
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            generate_tree(directory, size)
+            server = FakeNotionServer(latency, rate_limit_every).start()
+            try:
+                for scenario in SCENARIOS:
+                    if scenario == "edit":
+                        doc = next(pathlib.Path(directory).glob("docs/*/doc0.md"))
+                        doc.write_text(doc.read_text().replace(".", "!", 1))
+                    before = server.stats.as_dict()
+                    run = run_publish(directory, server.url, rate, concurrency)
+                    after = server.stats.as_dict()
+                    results.append(
+                        {
+                            "files": size,
+                            "scenario": scenario,
+                            "requests": after["requests"] - before["requests"],
+                            "rate_limited": after["rate_limited"]
+                            - before["rate_limited"],
+                            "bytes_sent": after["bytes_received"]
+                            - before["bytes_received"],
+                            **run,
+                        }
+                    )
+                    _report(results[-1])
+            finally:
+                server.stop()
+    return results
+
+
+def _report(result):
+    print(
+        "{files:>6} files {scenario:>5}: {requests:>7} requests "
+        "({rate_limited} rate limited) {wall_time:8.2f}s "
+        "{sent:>10.1f} KiB sent {rss:>8.1f} MiB peak RSS".format(
+            sent=result["bytes_sent"] / 1024,
+            rss=result["peak_rss"] / 1024 / 1024,
+            **result,
+        ),
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per request"
+    )
+    parser.add_argument(
+        "--rate-limit-every",
+        type=int,
+        default=0,
+        help="answer every Nth request with a 429",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=1000,
+        help="client rate limit in requests per second (notion allows 3)",
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--publish", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.publish:
+        _publish(args.publish, args.base_url, args.rate, args.concurrency)
+        sys.exit()
+
+    results = benchmark(
+        args.sizes, args.latency, args.rate_limit_every, args.rate, args.concurrency
+    )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
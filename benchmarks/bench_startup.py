@@ -0,0 +1,157 @@
+"""
+Cold start benchmark for the notionpub CLI: times `notionpub --help` and a
+no-op upload (every file already in the manifest) in fresh processes, and
+breaks their import time down with `python -X importtime`.
+
+    python benchmarks/bench_startup.py --repeat 10 --budget 0.6
+
+Exits with a non-zero status if a command's best wall time is over `--budget`
+seconds, or if it imports any of the modules only needed to convert or upload
+files (notion-py, md2notion, mistletoe).
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = ("help", "noop")
+
+# modules that neither scenario needs, and so must not import
+LAZY_MODULES = ("notion", "md2notion", "mistletoe")
+
+# default wall time budget per command, in seconds
+BUDGET = 1.0
+
+
+def generate_tree(root, n_files):
+    """write `n_files` markdown files under `root`, and a manifest that has all of them"""
+    from notionpub.manifest import Manifest, file_hash
+
+    root = pathlib.Path(root)
+    (root / "notionpub.yaml").write_text(
+        "root_page_id: '00000000000000000000000000000000'\n"
+        "manifest: manifest.json\n"
+        "paths:\n  - docs/**\n"
+    )
+    manifest = Manifest(str(root / "manifest.json"), root)
+    for i in range(n_files):
+        path = root / "docs" / "doc{}.md".format(i)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("# Document {}\n\nSome text.\n".format(i))
+        manifest.record(path.relative_to(root).as_posix(), file_hash(path), str(i))
+    manifest.save()
+
+
+def command(scenario, directory):
+    args = [sys.executable, "-m", "notionpub.main"]
+    if scenario == "help":
+        return args + ["--help"]
+    return args + ["upload", directory, "-c", os.path.join(directory, "notionpub.yaml")]
+
+
+def import_times(cmd):
+    """
+    The seconds spent importing, all modules imported, and the cumulative
+    import time of each top-level import, from `python -X importtime`.
+    """
+    out = subprocess.run(
+        cmd[:1] + ["-X", "importtime"] + cmd[1:],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    ).stderr
+    modules, top_level = [], {}
+    for line in out.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the header
+        modules.append(name.strip())
+        # nested imports are indented, and counted in their importer's time
+        if not name[1:].startswith(" "):
+            top_level[name.strip()] = int(cumulative) / 1e6
+    return sum(top_level.values()), modules, top_level
+
+
+def wall_time(cmd, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark(repeat, files):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        generate_tree(directory, files)
+        for scenario in SCENARIOS:
+            cmd = command(scenario, directory)
+            total, modules, top_level = import_times(cmd)
+            results.append(
+                {
+                    "scenario": scenario,
+                    "wall_time": wall_time(cmd, repeat),
+                    "import_time": total,
+                    "slowest_imports": dict(
+                        sorted(top_level.items(), key=lambda m: m[1], reverse=True)[:5]
+                    ),
+                    "lazy_imported": sorted(
+                        m for m in modules if m.split(".")[0] in LAZY_MODULES
+                    ),
+                }
+            )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=BUDGET,
+        help="fail if a command takes longer than this many seconds",
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = benchmark(args.repeat, args.files)
+    failed = False
+    for result in results:
+        print(
+            "{scenario:>5}: {wall_time:6.3f}s wall, {import_time:6.3f}s importing".format(
+                **result
+            )
+        )
+        for name, seconds in result["slowest_imports"].items():
+            print("       {:6.3f}s {}".format(seconds, name))
+        if result["wall_time"] > args.budget:
+            failed = True
+            print(
+                "{} is over budget: {:.3f}s > {:.3f}s".format(
+                    result["scenario"], result["wall_time"], args.budget
+                ),
+                file=sys.stderr,
+            )
+        if result["lazy_imported"]:
+            failed = True
+            print(
+                "{} imports {}".format(
+                    result["scenario"], ", ".join(result["lazy_imported"])
+                ),
+                file=sys.stderr,
+            )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,468 @@
+"""
+A local stand-in for the parts of the Notion API that notionpub uses, for
+benchmarks and offline experiments.
+
+Implements pages.create/retrieve/update, blocks.retrieve/update/delete,
+blocks.children.list/append (with pagination, `after`, nested children and the
+API's request limits) and single-part file uploads. Requests can be slowed
+down with a fixed latency, and a fraction of them answered with 429s.
+
+    server = FakeNotionServer(latency=0.05, rate_limit_every=50)
+    server.start()
+    client = NotionClient("secret", base_url=server.url)
+    ...
+    print(server.stats)
+    server.stop()
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MAX_CHILDREN = 100
+MAX_NESTING = 2
+MAX_BLOCKS_PER_REQUEST = 1000
+MAX_PAYLOAD_BYTES = 500 * 1000
+PAGE_SIZE = 100
+
+ROOT_PAGE_ID = "00000000-0000-0000-0000-000000000000"
+
+_ROUTES = [
+    ("POST", r"/v1/pages", "pages.create"),
+    ("GET", r"/v1/pages/(?P<id>[^/]+)", "pages.retrieve"),
+    ("PATCH", r"/v1/pages/(?P<id>[^/]+)", "pages.update"),
+    ("GET", r"/v1/blocks/(?P<id>[^/]+)/children", "blocks.children.list"),
+    ("PATCH", r"/v1/blocks/(?P<id>[^/]+)/children", "blocks.children.append"),
+    ("GET", r"/v1/blocks/(?P<id>[^/]+)", "blocks.retrieve"),
+    ("PATCH", r"/v1/blocks/(?P<id>[^/]+)", "blocks.update"),
+    ("DELETE", r"/v1/blocks/(?P<id>[^/]+)", "blocks.delete"),
+    ("POST", r"/v1/file_uploads", "file_uploads.create"),
+    ("POST", r"/v1/file_uploads/(?P<id>[^/]+)/send", "file_uploads.send"),
+]
+
+
+class NotionError(Exception):
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = collections.Counter()
+        self.rate_limited = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    def record(self, endpoint, received, sent, rate_limited=False):
+        with self._lock:
+            self.requests[endpoint] += 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+            self.rate_limited += rate_limited
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "requests": sum(self.requests.values()),
+                "requests_by_endpoint": dict(self.requests),
+                "rate_limited": self.rate_limited,
+                "bytes_received": self.bytes_received,
+                "bytes_sent": self.bytes_sent,
+            }
+
+
+class FakeNotion:
+    """The in-memory workspace behind FakeNotionServer."""
+
+    def __init__(self, root_page_id=ROOT_PAGE_ID):
+        self._lock = threading.RLock()
+        self.blocks = {}
+        self.children = collections.defaultdict(list)
+        self.file_uploads = {}
+        self._new(None, _child_page("root"), id=root_page_id)
+
+    def content(self, block_id):
+        """the live children of a block as (type, content, children) tuples, without ids"""
+        with self._lock:
+            content = []
+            for child_id in self.children[block_id]:
+                block = self.blocks[child_id]
+                if not block["archived"]:
+                    data = dict(block[block["type"]])
+                    data.pop("children", None)
+                    content.append((block["type"], data, self.content(child_id)))
+            return content
+
+    def descendants(self, block_id):
+        """the ids of all live blocks beneath a block"""
+        with self._lock:
+            ids = set()
+            for child_id in self.children[block_id]:
+                if not self.blocks[child_id]["archived"]:
+                    ids |= {child_id} | self.descendants(child_id)
+            return ids
+
+    def handle(self, endpoint, id, query, body):
+        with self._lock:
+            return getattr(self, endpoint.replace(".", "_"))(id, query, body)
+
+    def pages_create(self, _, query, body):
+        parent_id = body["parent"]["page_id"]
+        self._get(parent_id)
+        title = "".join(
+            t["text"]["content"] for t in body["properties"]["title"]["title"]
+        )
+        block = self._new(parent_id, _child_page(title))
+        for child in body.get("children", []):
+            self._new(block["id"], child)
+        return self._page(block)
+
+    def pages_retrieve(self, id, query, body):
+        return self._page(self._get(id, "child_page"))
+
+    def pages_update(self, id, query, body):
+        block = self._get(id, "child_page")
+        if body.get("archived"):
+            self._archive(block)
+        return self._page(block)
+
+    def blocks_retrieve(self, id, query, body):
+        return self._get(id)
+
+    def blocks_update(self, id, query, body):
+        block = self._get(id)
+        if block["type"] not in body:
+            raise NotionError(400, "validation_error", "block type mismatch")
+        block[block["type"]].update(_with_plain_text(body[block["type"]]))
+        self._touch(block)
+        return block
+
+    def blocks_delete(self, id, query, body):
+        block = self._get(id)
+        self._archive(block)
+        return block
+
+    def blocks_children_list(self, id, query, body):
+        self._get(id)
+        children = [c for c in self.children[id] if not self.blocks[c]["archived"]]
+        start = children.index(query["start_cursor"]) if "start_cursor" in query else 0
+        size = min(int(query.get("page_size", PAGE_SIZE)), PAGE_SIZE)
+        page = children[start : start + size]
+        has_more = start + size < len(children)
+        return _list(
+            [self.blocks[c] for c in page],
+            next_cursor=children[start + size] if has_more else None,
+        )
+
+    def blocks_children_append(self, id, query, body):
+        parent = self._get(id)
+        children = body.get("children", [])
+        _check_limits(children)
+        after = body.get("after")
+        if after is not None and after not in self.children[id]:
+            raise NotionError(
+                400, "validation_error", "after is not a child of the block"
+            )
+        results = []
+        for child in children:
+            results.append(self._new(id, child, after=after))
+            after = after and results[-1]["id"]
+        self._touch(parent)
+        return _list(results)
+
+    def file_uploads_create(self, id, query, body):
+        upload = {
+            "object": "file_upload",
+            "id": str(uuid.uuid4()),
+            "status": "pending",
+            "filename": body.get("filename"),
+            "content_type": body.get("content_type"),
+        }
+        self.file_uploads[upload["id"]] = upload
+        return upload
+
+    def file_uploads_send(self, id, query, body):
+        if id not in self.file_uploads:
+            raise NotionError(404, "object_not_found", "no such file upload")
+        self.file_uploads[id]["status"] = "uploaded"
+        return self.file_uploads[id]
+
+    def _new(self, parent_id, content, after=None, id=None):
+        block_type = content["type"]
+        data = dict(content.get(block_type, {}))
+        children = data.pop("children", [])
+        now = _now()
+        block = {
+            "object": "block",
+            "id": id or str(uuid.uuid4()),
+            "parent": {"type": "page_id", "page_id": parent_id},
+            "created_time": now,
+            "last_edited_time": now,
+            "has_children": False,
+            "archived": False,
+            "type": block_type,
+            block_type: self._attach(_with_plain_text(data)),
+        }
+        self.blocks[block["id"]] = block
+        if parent_id is not None:
+            siblings = self.children[parent_id]
+            index = siblings.index(after) + 1 if after else len(siblings)
+            siblings.insert(index, block["id"])
+            self.blocks[parent_id]["has_children"] = True
+        for child in children:
+            self._new(block["id"], child)
+        return block
+
+    def _attach(self, data):
+        """
+        Like the API, a block that attaches a file upload comes back as a
+        "file" block, with a signed url that differs for every block.
+        """
+        if data.get("type") != "file_upload":
+            return data
+        upload = self.file_uploads.get(data["file_upload"]["id"])
+        if upload is None or upload["status"] != "uploaded":
+            raise NotionError(
+                400, "validation_error", "file upload is not uploaded or expired"
+            )
+        data = {k: v for k, v in data.items() if k != "file_upload"}
+        url = "https://files.example.com/{}/{}?signature={}".format(
+            upload["id"], upload["filename"], uuid.uuid4().hex
+        )
+        return {**data, "type": "file", "file": {"url": url, "expiry_time": _now()}}
+
+    def _get(self, id, block_type=None):
+        block = self.blocks.get(id)
+        if block is None or (block_type and block["type"] != block_type):
+            raise NotionError(404, "object_not_found", "Could not find {}".format(id))
+        if block["archived"]:
+            raise NotionError(
+                400, "validation_error", "Can't edit block that is archived"
+            )
+        return block
+
+    def _archive(self, block):
+        block["archived"] = True
+        parent_id = block["parent"]["page_id"]
+        self.children[parent_id].remove(block["id"])
+        self.blocks[parent_id]["has_children"] = bool(self.children[parent_id])
+        self._touch(self.blocks[parent_id])
+
+    def _touch(self, block):
+        block["last_edited_time"] = _now()
+
+    def _page(self, block):
+        return {
+            "object": "page",
+            "id": block["id"],
+            "created_time": block["created_time"],
+            "last_edited_time": block["last_edited_time"],
+            "archived": block["archived"],
+            "parent": block["parent"],
+            "properties": {
+                "title": {
+                    "id": "title",
+                    "type": "title",
+                    "title": _rich_text(block["child_page"]["title"]),
+                }
+            },
+        }
+
+
+class FakeNotionServer:
+    """
+    Serves a FakeNotion workspace over HTTP on localhost.
+    `latency` seconds are added to every request, and every
+    `rate_limit_every`th request is answered with a 429.
+    """
+
+    def __init__(self, latency=0.0, rate_limit_every=0, retry_after=1, port=0):
+        self.notion = FakeNotion()
+        self.stats = Stats()
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self._count = 0
+        self._count_lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    @property
+    def root_page_id(self):
+        return ROOT_PAGE_ID
+
+    def start(self):
+        # poll for shutdown often, so stopping a server is quick
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _rate_limited(self):
+        if not self.rate_limit_every:
+            return False
+        with self._count_lock:
+            self._count += 1
+            return self._count % self.rate_limit_every == 0
+
+
+def _handler(server: FakeNotionServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # headers and body are written separately; don't let delayed ACKs
+        # stall every response
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_PATCH(self):
+            self._handle("PATCH")
+
+        def do_DELETE(self):
+            self._handle("DELETE")
+
+        def log_message(self, format, *args):
+            pass
+
+        def _handle(self, method):
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length) if length else b""
+            path, _, query = self.path.partition("?")
+            endpoint, id = _route(method, path)
+            if server.latency:
+                time.sleep(server.latency)
+            headers = {}
+            if endpoint is None:
+                status, response = 400, _error(
+                    400, "invalid_request_url", "Invalid request URL."
+                )
+            elif server._rate_limited():
+                headers["Retry-After"] = str(server.retry_after)
+                status, response = 429, _error(429, "rate_limited", "Rate limited")
+            else:
+                try:
+                    body = {}
+                    if raw and endpoint != "file_uploads.send":
+                        _check_size(raw)
+                        body = json.loads(raw)
+                    query = dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+                    status, response = 200, server.notion.handle(
+                        endpoint, id, query, body
+                    )
+                except NotionError as e:
+                    status, response = e.status, _error(e.status, e.code, str(e))
+            data = json.dumps(response).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+            server.stats.record(endpoint or path, len(raw), len(data), status == 429)
+
+    return Handler
+
+
+def _route(method, path):
+    for route_method, pattern, endpoint in _ROUTES:
+        match = re.fullmatch(pattern, path)
+        if route_method == method and match:
+            return endpoint, match.groupdict().get("id")
+    return None, None
+
+
+def _check_size(raw):
+    if len(raw) > MAX_PAYLOAD_BYTES:
+        raise NotionError(413, "validation_error", "request body is larger than 500KB")
+
+
+def _check_limits(children, depth=0):
+    if len(children) > MAX_CHILDREN:
+        raise NotionError(400, "validation_error", "children length should be ≤ 100")
+    if depth > MAX_NESTING:
+        raise NotionError(400, "validation_error", "too many levels of nesting")
+    total = 0
+    for child in children:
+        nested = child.get(child["type"], {}).get("children", [])
+        total += 1 + _check_limits(nested, depth + 1) if nested else 1
+    if depth == 0 and total > MAX_BLOCKS_PER_REQUEST:
+        raise NotionError(400, "validation_error", "too many blocks in one request")
+    return total
+
+
+def _child_page(title):
+    return {"type": "child_page", "child_page": {"title": title}}
+
+
+def _with_plain_text(data):
+    if "rich_text" in data:
+        data = {
+            **data,
+            "rich_text": [
+                {**t, "plain_text": t.get("text", {}).get("content", "")}
+                for t in data["rich_text"]
+            ],
+        }
+    return data
+
+
+def _rich_text(content):
+    return [{"type": "text", "text": {"content": content}, "plain_text": content}]
+
+
+def _list(results, next_cursor=None):
+    return {
+        "object": "list",
+        "results": results,
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None,
+    }
+
+
+def _error(status, code, message):
+    return {"object": "error", "status": status, "code": code, "message": message}
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(
+        timespec="milliseconds"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8484)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    args = parser.parse_args()
+    server = FakeNotionServer(args.latency, args.rate_limit_every, port=args.port)
+    print("fake notion api on {}, root page {}".format(server.url, server.root_page_id))
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
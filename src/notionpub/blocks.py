@@ -0,0 +1,338 @@
+import hashlib
+import json
+import logging
+from collections import UserDict
+
+from notionpub import notion
+
+logger = logging.getLogger(__name__)
+
+# room left in an append request's body for everything but the children
+# (the `children` key, the `after` id and the list's commas)
+_REQUEST_OVERHEAD = 1000
+
+
+def paragraph_to_blocks(children, image_handler):
+    from notion.block import EmbedOrUploadBlock
+
+    rich_text, images = [], []
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    def text_to_block(t):
+        if debug:
+            logger.debug("paragraph child: %r", t)
+        if isinstance(t, str):
+            return {"type": "text", "text": {"content": t}}
+        elif issubclass(t["type"], EmbedOrUploadBlock):
+            # always assumes external file url
+            return image_handler(t)
+        else:
+            return notion.BlockFactory().new_text_block(
+                t["title"],
+                **{
+                    "bold": t.get("_strong", False),
+                    "italic": t.get("_emphasis", False),
+                    "strikethrough": t.get("_strikethrough", False),
+                    "underline": t.get("_underline", False),
+                    "code": t.get("_code", False),
+                    "color": "default",
+                },
+            )
+
+    for child in children:
+        b = text_to_block(child)
+        if b is None:
+            continue
+        elif b["type"] == "text":
+            rich_text.append(b)
+        elif b["type"] == "image":
+            images.append(b)
+        else:
+            raise ValueError("unsupported paragraph child: " + b["type"])
+    return {"rich_text": rich_text, "children": images}
+
+
+class ChildrenAdapter:
+    def __init__(
+        self, parent_id, client: notion.NotionClient, buffered=False, images=None
+    ) -> None:
+        self._parent_id = parent_id
+        self._client = client
+        self._buffered = buffered
+        # image source -> id of the file upload holding that (local) image
+        self._images = images or {}
+        self._blocks = []
+
+    def image_handler(self, image_block):
+        if image_block["source"].startswith("http"):
+            return {
+                "type": "image",
+                "image": {
+                    "type": "external",
+                    "external": {"url": image_block["source"]},
+                },
+            }
+        elif image_block["source"] in self._images:
+            return {
+                "type": "image",
+                "image": {
+                    "type": "file_upload",
+                    "file_upload": {"id": self._images[image_block["source"]]},
+                },
+            }
+        else:
+            return notion.BlockFactory().new_text_block(
+                "Image {} was not uploaded".format(image_block["source"]),
+                color="red",
+            )
+
+    def add_new(self, block_type, child_list_key=None, **kwargs):
+        """
+        Create a new block, add it as the last child of this parent block, and return the corresponding Block instance.
+        `block_type` can be either a type string, or a Block subclass.
+        """
+
+        from notion.block import Block
+
+        # determine the block type string from the Block class, if that's what was provided
+        if (
+            isinstance(block_type, type)
+            and issubclass(block_type, Block)
+            and hasattr(block_type, "_type")
+        ):
+            block_type = block_type._type
+        elif not isinstance(block_type, str):
+            raise Exception(
+                "block_type must be a string or a Block subclass with a _type attribute"
+            )
+
+        headers = {
+            "header": "heading_1",
+            "sub_header": "heading_2",
+            "sub_sub_header": "heading_3",
+        }
+
+        block_factory = notion.BlockFactory()
+        if block_type in headers.keys():
+            block_type = headers[block_type]
+            block_content = {
+                "object": "block",
+                "type": block_type,
+                block_type: {
+                    "rich_text": [block_factory.new_text_block(kwargs["title"])]
+                },
+            }
+        elif block_type == "text":
+            block_type = "paragraph"
+            block_content = {
+                "object": "block",
+                "type": block_type,
+                block_type: {
+                    "rich_text": [block_factory.new_text_block(kwargs["title"])]
+                },
+            }
+        elif block_type == "bulleted_list":
+            block_type = "bulleted_list_item"
+            block_content = {
+                "object": "block",
+                "type": block_type,
+                block_type: {
+                    "rich_text": [block_factory.new_text_block(kwargs["title"])]
+                },
+            }
+        elif block_type == "paragraph":
+            block_content = {
+                "object": "block",
+                "type": block_type,
+                block_type: paragraph_to_blocks(
+                    kwargs["rich_text"], self.image_handler
+                ),
+            }
+        elif block_type == "numbered_list":
+            block_type = "numbered_list_item"
+            block_content = {
+                "object": "block",
+                "type": block_type,
+                block_type: {
+                    "rich_text": [block_factory.new_text_block(kwargs["title"])]
+                },
+            }
+        else:
+            block_content = {
+                "object": "block",
+                "type": block_type,
+                block_type: kwargs,
+            }
+            logger.debug("unsupported block: %s", block_content)
+            raise ValueError("unsupported block " + block_type)
+
+        if self._buffered:
+            block = PendingBlock(block_content, self._client, self._images)
+            self._blocks.append(block)
+            return block
+
+        response = self._client.create_block(
+            parent_id=self._parent_id, block=block_content
+        )
+        if "id" in response:
+            return PageAdapter(response, self._client)
+        if "results" in response:
+            return PageAdapter(response["results"][0], self._client)
+        logger.warning("unexpected response when creating a block: %s", response)
+        return response
+
+    def skip(self, n):
+        """drop the first `n` buffered blocks, e.g. ones already appended"""
+        del self._blocks[:n]
+
+    def flush(self, after=None, confirm=None):
+        """
+        Append all buffered blocks to the parent, packing siblings into as few
+        requests as the API allows. Children are sent inline with their parent
+        when the nesting limit permits; otherwise they are appended in a
+        follow-up request, once the parent's id is known.
+        If `after` is given, the blocks are inserted after that existing child
+        instead of at the end.
+        If `confirm` is given, it is called with the number of blocks appended
+        so far and the last of them, each time a batch of blocks and all of
+        their children have been appended.
+        """
+        pending, self._blocks = self._blocks, []
+        appended = 0
+        for batch in _batches(pending):
+            results = self._client.append_blocks(
+                self._parent_id,
+                [block.payload(inline) for block, inline in batch],
+                after=after,
+            )
+            if after is not None:
+                after = results[-1]["id"]
+            for (block, inline), result in zip(batch, results):
+                block.update(result)
+                if not inline:
+                    block.children._parent_id = result["id"]
+                    block.children.flush()
+            appended += len(batch)
+            if confirm is not None:
+                confirm(appended, batch[-1][0])
+
+
+class PendingBlock(UserDict):
+    """
+    A block added to a buffered ChildrenAdapter that has not been appended yet.
+    Its API response (including the `id`) is filled in when the parent is flushed.
+    """
+
+    def __init__(self, content, client, images=None):
+        self.content = content
+        self.children = ChildrenAdapter(None, client, buffered=True, images=images)
+        super().__init__()
+
+    def _static_children(self):
+        # children already embedded in the block content, e.g. paragraph images
+        return self.content[self.content["type"]].get("children", [])
+
+    def height(self):
+        """levels of children beneath this block"""
+        heights = [b.height() + 1 for b in self.children._blocks]
+        if self._static_children():
+            heights.append(1)
+        return max(heights, default=0)
+
+    def size(self, inline=True):
+        """number of blocks sent when this block is appended"""
+        size = 1 + len(self._static_children())
+        if inline:
+            size += sum(b.size() for b in self.children._blocks)
+        return size
+
+    def payload_size(self, inline=True):
+        """size of this block in the body of the request that appends it"""
+        return len(json.dumps(self.payload(inline)))
+
+    def children_digest(self):
+        """
+        A hash of this block's children, or None if it has none. Recorded when
+        the block is published, so a later patch can tell they are unchanged
+        without listing them.
+        """
+        children = self._static_children() + [
+            b.payload() for b in self.children._blocks
+        ]
+        if not children:
+            return None
+        data = json.dumps(children, sort_keys=True).encode()
+        return hashlib.sha256(data).hexdigest()[:16]
+
+    def image_uploads(self):
+        """the ids of the file uploads attached by this block's image children, in order"""
+        children = self._static_children() + [b.content for b in self.children._blocks]
+        return [
+            c["image"]["file_upload"]["id"]
+            for c in children
+            if c["type"] == "image" and c["image"].get("type") == "file_upload"
+        ]
+
+    def inlinable(self):
+        """whether this block's descendants can be sent in the same request"""
+
+        def fits(block):
+            children = block._static_children() + block.children._blocks
+            return len(children) <= notion.MAX_CHILDREN and all(
+                fits(b) for b in block.children._blocks
+            )
+
+        return (
+            self.height() <= notion.MAX_NESTING
+            and self.size() <= notion.MAX_BLOCKS_PER_REQUEST
+            and fits(self)
+            and self.payload_size() <= notion.MAX_PAYLOAD_BYTES - _REQUEST_OVERHEAD
+        )
+
+    def payload(self, inline=True):
+        if not inline or not self.children._blocks:
+            return self.content
+        block_type = self.content["type"]
+        return {
+            **self.content,
+            block_type: {
+                **self.content[block_type],
+                "children": self._static_children()
+                + [b.payload() for b in self.children._blocks],
+            },
+        }
+
+
+def _batches(blocks):
+    """
+    Group sibling blocks into batches that each fit in a single append request,
+    yielding lists of (block, inline) pairs. A block whose children are too big
+    to send with it is sent without them, and its children appended afterwards.
+    """
+    max_bytes = notion.MAX_PAYLOAD_BYTES - _REQUEST_OVERHEAD
+    batch, size, nbytes = [], 0, 0
+    for block in blocks:
+        inline = block.inlinable()
+        n = block.size(inline)
+        b = block.payload_size(inline)
+        if batch and (
+            len(batch) == notion.MAX_CHILDREN
+            or size + n > notion.MAX_BLOCKS_PER_REQUEST
+            or nbytes + b > max_bytes
+        ):
+            yield batch
+            batch, size, nbytes = [], 0, 0
+        batch.append((block, inline))
+        size += n
+        nbytes += b + 2  # the ", " between list items
+    if batch:
+        yield batch
+
+
+class PageAdapter(UserDict):
+    def __init__(self, page, client, buffered=False, images=None):
+        self.page = page
+        self.children = ChildrenAdapter(
+            page["id"], client, buffered=buffered, images=images
+        )
+        super().__init__(page)
@@ -1,13 +1,28 @@
-from typing import Union, List
+import os
+from typing import Literal, Optional, Union, List
 
 import pydantic
 import yaml
 
+# directory (relative to the config file) holding notionpub's local state
+STATE_DIR = ".notionpub"
+
 
 @pydantic.dataclasses.dataclass
 class ConfigFile:
     root_page_id: str
     paths: List[Union[str, dict]]
+    state_dir: str = STATE_DIR
+    manifest: Optional[str] = None
+    # how to publish a changed file whose page already exists:
+    # "patch" edits the existing page's blocks in place,
+    # "recreate" deletes the page and creates it again from scratch
+    update: Literal["patch", "recreate"] = "patch"
+    # keep the title -> page id index of directory pages between runs
+    cache_index: bool = False
+
+    def state_path(self, name):
+        return os.path.join(self.state_dir, name)
 
 
 def load_config(file):
@@ -16,4 +31,11 @@ def load_config(file):
         cfg = ConfigFile(**contents)
     except pydantic.ValidationError:
         raise
+    # paths in the config are relative to the config file itself
+    config_dir = os.path.dirname(getattr(file, "name", ""))
+    cfg.state_dir = os.path.join(config_dir, cfg.state_dir)
+    if cfg.manifest:
+        cfg.manifest = os.path.join(config_dir, cfg.manifest)
+    else:
+        cfg.manifest = cfg.state_path("manifest.json")
     return cfg
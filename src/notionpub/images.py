@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from notionpub import notion
+from notionpub.manifest import file_hash
+
+logger = logging.getLogger(__name__)
+
+# number of images uploaded at once; requests still go through the client's rate limiter
+IMAGE_WORKERS = 4
+
+
+class ImageUploader:
+    """
+    Uploads local images with the Notion file upload API. Images are addressed
+    by the hash of their contents, so each distinct image is uploaded once, no
+    matter how many files reference it. With a `path`, the hash -> file upload
+    id mapping is kept between runs, so an image is never uploaded twice.
+    Notion expires file uploads that aren't attached to a block within an
+    hour, so an upload is only kept once `attached` has been called with it.
+    Safe to share between threads.
+    """
+
+    def __init__(self, client: notion.NotionClient, path=None, workers=IMAGE_WORKERS):
+        self._client = client
+        self.path = path
+        self._uploaded = {}  # hash -> file upload id, of attached uploads
+        self._unattached = {}  # file upload id -> hash
+        self._uploads = {}  # hash -> Future of file upload id, for this run
+        self._hashes = {}  # (path, mtime, size) -> hash
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        if path:
+            try:
+                with open(path, "r") as f:
+                    self._uploaded = json.load(f)
+            except FileNotFoundError:
+                pass
+            except json.JSONDecodeError:
+                logger.warning("ignoring unreadable image cache '%s'", path)
+
+    def upload_all(self, sources, md_file_path):
+        """
+        Upload the local images referenced from a markdown file, concurrently.
+        Returns a dict of image source (as written in the markdown) to file
+        upload id, leaving out images that could not be found or uploaded.
+        """
+        from md2notion.upload import relativePathForMarkdownUrl
+
+        uploads = {}
+        for source in sources:
+            path = relativePathForMarkdownUrl(source, md_file_path)
+            if path is None:
+                logger.warning("local image '%s' not found to upload", source)
+                continue
+            if os.path.getsize(path) > notion.MAX_UPLOAD_SIZE:
+                logger.warning("local image '%s' is too large to upload", source)
+                continue
+            uploads[source] = self._upload(path)
+        ids = {}
+        for source, upload in uploads.items():
+            try:
+                ids[source] = upload.result()
+            except Exception as e:
+                logger.warning("could not upload local image '%s': %s", source, e)
+        return ids
+
+    def attached(self, ids):
+        """record that the file uploads `ids` are attached to blocks, so they can be kept"""
+        with self._lock:
+            for file_upload_id in ids:
+                digest = self._unattached.pop(file_upload_id, None)
+                if digest is not None:
+                    self._uploaded[digest] = file_upload_id
+
+    def forget_unattached(self):
+        """
+        Drop the uploads that weren't attached, e.g. because their page failed
+        to publish, so they are uploaded again when next needed instead of
+        reusing an upload that may have expired by then.
+        """
+        with self._lock:
+            for digest in self._unattached.values():
+                self._uploads.pop(digest, None)
+            self._unattached.clear()
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with self._lock:
+            with open(tmp, "w") as f:
+                json.dump(self._uploaded, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+
+    def close(self):
+        self._pool.shutdown()
+
+    def _upload(self, path):
+        digest = self._hash(path)
+        with self._lock:
+            upload = self._uploads.get(digest)
+            if upload is None:
+                upload = self._pool.submit(self._upload_once, digest, path)
+                self._uploads[digest] = upload
+        return upload
+
+    def _upload_once(self, digest, path):
+        with self._lock:
+            file_upload_id = self._uploaded.get(digest)
+        if file_upload_id is None:
+            file_upload_id = self._client.upload_file(str(path))
+            with self._lock:
+                self._unattached[file_upload_id] = digest
+        return file_upload_id
+
+    def _hash(self, path):
+        stat = os.stat(path)
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._hashes.get(key)
+        if digest is None:
+            digest = file_hash(path)
+            with self._lock:
+                self._hashes[key] = digest
+        return digest
+
+
+def file_upload_ids(payloads):
+    """the ids of the file uploads referenced in block payloads"""
+    ids = set()
+    for payload in payloads:
+        if isinstance(payload, list):
+            ids |= file_upload_ids(payload)
+        elif isinstance(payload, dict):
+            if payload.get("type") == "file_upload":
+                ids.add(payload["file_upload"]["id"])
+            ids |= file_upload_ids(payload.values())
+    return ids
+
+
+def local_images(blocks):
+    """the sources of all local (not http/https) images in block descriptors"""
+    from notion.block import EmbedOrUploadBlock
+
+    sources = []
+    for block in blocks:
+        if not isinstance(block, dict):
+            continue
+        block_type = block.get("type")
+        if isinstance(block_type, type) and issubclass(block_type, EmbedOrUploadBlock):
+            if not re.search(r"(?<!file)://", block["source"], re.I):
+                sources.append(block["source"])
+        sources += local_images(block.get("rich_text", []))
+        sources += local_images(block.get("children", []))
+    return sources
@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import threading
+
+from notionpub import notion
+
+logger = logging.getLogger(__name__)
+
+
+class ChildPageIndex:
+    """
+    Maps the titles of each parent page's child pages to their ids.
+    A parent's children are listed (following pagination) the first time it is
+    looked up, and the index is kept up to date as pages are created and
+    deleted, so each parent is listed at most once per run.
+    With a `path`, the index is also kept between runs: a parent's entry is
+    reused as long as the parent's `last_edited_time` hasn't changed.
+    Safe to share between threads.
+    """
+
+    def __init__(self, client: notion.NotionClient, path=None):
+        self._client = client
+        self.path = path
+        self._cached = {}
+        # parent id -> {"last_edited_time": ..., "pages": {title: id}}
+        self._parents = {}
+        self._lock = threading.Lock()
+        self._parent_locks = {}
+        if path:
+            try:
+                with open(path, "r") as f:
+                    self._cached = json.load(f)
+            except FileNotFoundError:
+                pass
+            except json.JSONDecodeError:
+                logger.warning("ignoring unreadable page index '%s'", path)
+
+    def get(self, parent_id, title):
+        """the id of the child page of `parent_id` titled `title`, or None"""
+        return self._pages(parent_id).get(title)
+
+    def find_or_create(self, parent_id, title):
+        with self._parent_lock(parent_id):
+            page_id = self.get(parent_id, title)
+            if page_id is None:
+                page_id = self._client.create_page(parent_id, title)["id"]
+                self.add(parent_id, title, page_id)
+        return page_id
+
+    def add(self, parent_id, title, page_id):
+        pages = self._pages(parent_id)
+        with self._lock:
+            pages.setdefault(title, page_id)
+            # our own edit changes the parent, so revalidate it next run
+            self._parents[parent_id]["last_edited_time"] = None
+
+    def remove(self, page_id):
+        """drop a deleted or archived page from the index"""
+        with self._lock:
+            entries = list(self._parents.items()) + list(self._cached.items())
+            for parent_id, entry in entries:
+                for title, id in list(entry["pages"].items()):
+                    if id == page_id:
+                        del entry["pages"][title]
+                        entry["last_edited_time"] = None
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with self._lock:
+            entries = {**self._cached, **self._parents}
+            with open(tmp, "w") as f:
+                json.dump(entries, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+
+    def _pages(self, parent_id):
+        with self._lock:
+            entry = self._parents.get(parent_id)
+        if entry is not None:
+            return entry["pages"]
+        with self._parent_lock(parent_id):
+            with self._lock:
+                entry = self._parents.get(parent_id)
+            if entry is None:
+                entry = self._load(parent_id)
+                with self._lock:
+                    self._parents[parent_id] = entry
+        return entry["pages"]
+
+    def _parent_lock(self, parent_id):
+        # held while a parent is listed or has a page created under it
+        with self._lock:
+            return self._parent_locks.setdefault(parent_id, threading.RLock())
+
+    def _load(self, parent_id):
+        last_edited_time = None
+        if self.path:
+            last_edited_time = self._client.get_block(parent_id)["last_edited_time"]
+            cached = self._cached.get(parent_id)
+            if cached and cached["last_edited_time"] == last_edited_time:
+                return cached
+        pages = {}
+        for child in self._client.iter_children(parent_id):
+            if child["type"] == "child_page":
+                pages.setdefault(child["child_page"]["title"], child["id"])
+        return {"last_edited_time": last_edited_time, "pages": pages}
@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+
+
+class Journal:
+    """
+    A write-ahead log of the pages being written, so an interrupted upload can
+    be resumed. For each file being published it records the hash of the
+    contents being written, the page they are written to, and how many of the
+    page's top-level blocks have been appended so far (with the id of the last
+    one). Records are appended to the file as they happen; a file's entry is
+    dropped once it has been recorded in the manifest.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path, entries=None):
+        self.path = path
+        self._entries = entries or {}
+        self._lock = threading.Lock()
+        self._file = None
+
+    @classmethod
+    def load(cls, path):
+        """replay the journal at `path`, ignoring a torn last line"""
+        entries = {}
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    relpath = record.pop("path")
+                    if record.get("done"):
+                        entries.pop(relpath, None)
+                    else:
+                        entries[relpath] = record
+        except FileNotFoundError:
+            pass
+        return cls(path, entries)
+
+    def get(self, relpath, digest):
+        """the unfinished entry for `relpath`, if it was writing `digest`"""
+        entry = self._entries.get(relpath)
+        if entry is not None and entry["hash"] == digest:
+            return entry
+        return None
+
+    def begin(self, relpath, digest, page_id, blocks=0, block_id=None):
+        self._write(
+            relpath,
+            {
+                "hash": digest,
+                "page_id": page_id,
+                "blocks": blocks,
+                "block_id": block_id,
+            },
+        )
+
+    def confirm(self, relpath, blocks, block_id):
+        """record that the first `blocks` top-level blocks, up to `block_id`, exist"""
+        with self._lock:
+            entry = dict(self._entries[relpath], blocks=blocks, block_id=block_id)
+        self._write(relpath, entry)
+
+    def finish(self, relpath):
+        if relpath in self._entries:
+            self._write(relpath, {"done": True})
+
+    def retain(self, relpaths):
+        """forget entries for files other than `relpaths`"""
+        for relpath in set(self._entries) - set(relpaths):
+            self.finish(relpath)
+
+    def close(self):
+        """close the journal, removing it if no upload is left unfinished"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if not self._entries and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _write(self, relpath, record):
+        with self._lock:
+            if record.get("done"):
+                self._entries.pop(relpath, None)
+            else:
+                self._entries[relpath] = record
+            if self._file is None:
+                # start each run from a compacted copy, which also drops a torn
+                # record left by a crash
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp = self.path + ".tmp"
+                with open(tmp, "w") as f:
+                    for path, entry in self._entries.items():
+                        if path != relpath:
+                            f.write(json.dumps({"path": path, **entry}) + "\n")
+                os.replace(tmp, self.path)
+                self._file = open(self.path, "a")
+            self._file.write(json.dumps({"path": relpath, **record}) + "\n")
+            # hand the record to the OS before the next request is sent
+            self._file.flush()
@@ -1,238 +1,505 @@
 import argparse
-from collections import UserDict, defaultdict
+from collections import defaultdict
 from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import logging
 import os
 import pathlib
 import pprint
 import re
+import threading
 from typing import Generator, Iterator
-from notion.block import Block, Children, EmbedOrUploadBlock, ImageBlock
 
+from notion_client import APIResponseError
 
-from notionpub import config, notion
-from md2notion.upload import (
-    convert,
-    relativePathForMarkdownUrl,
-    uploadBlock as md_upload_block,
-)
+from notionpub import config, notion, parse, patch, watch
+from notionpub.blocks import PageAdapter
+from notionpub.images import ImageUploader, file_upload_ids, local_images
+from notionpub.index import ChildPageIndex
+from notionpub.journal import Journal
+from notionpub.manifest import Manifest, file_hash
+from notionpub.profile import TOP_FILES, Profiler
+
+# default number of upload workers; requests are rate limited across all of them
+CONCURRENCY = 4
+
+# seconds `watch` waits before retrying changes that failed to publish
+WATCH_RETRY_DELAY = 30
 
+logger = logging.getLogger(__name__)
+
+common = argparse.ArgumentParser(add_help=False)
+common.add_argument("--config", "-c", required=False, default="notionpub.yaml")
+common.add_argument(
+    "--concurrency",
+    type=int,
+    default=CONCURRENCY,
+    help="number of files and directories published in parallel",
+)
+common.add_argument(
+    "--parse-workers",
+    type=int,
+    default=None,
+    help="number of processes converting markdown (default: one per CPU)",
+)
+common.add_argument(
+    "--verbose",
+    "-v",
+    action="count",
+    default=0,
+    help="log more detail (-vv also logs the libraries notionpub uses)",
+)
 
 parser = argparse.ArgumentParser()
 subparsers = parser.add_subparsers(dest="subcommand")
-upload = subparsers.add_parser("upload")
+upload = subparsers.add_parser("upload", parents=[common])
 
 upload.add_argument("directory")
-upload.add_argument("--config", "-c", required=False, default="notionpub.yaml")
+upload.add_argument(
+    "--force",
+    action="store_true",
+    help="re-publish every file, even if it is unchanged since the last upload",
+)
+upload.add_argument(
+    "--profile",
+    metavar="PATH",
+    help="write a JSON report of requests and per-file timings to PATH",
+)
+upload.add_argument(
+    "--profile-top",
+    type=int,
+    default=TOP_FILES,
+    metavar="N",
+    help="number of slowest files to summarize with --profile",
+)
+
+watch_parser = subparsers.add_parser(
+    "watch", parents=[common], help="publish, then republish files as they change"
+)
+watch_parser.add_argument("directory")
+watch_parser.add_argument(
+    "--interval",
+    type=float,
+    default=watch.POLL_INTERVAL,
+    help="seconds between checks for changed files",
+)
+watch_parser.add_argument(
+    "--debounce",
+    type=float,
+    default=watch.DEBOUNCE,
+    help="seconds files must stay unchanged before they are published",
+)
 
 
 def main():
     args = parser.parse_args()
+    _configure_logging(getattr(args, "verbose", 0))
     if args.subcommand == "upload":
         with open(args.config, "r") as f:
             cfg = config.load_config(f)
-        _upload(args.directory, cfg)
-
-
-def paragraph_to_blocks(children, image_handler):
-    rich_text, images = [], []
-
-    def text_to_block(t):
-        print(t)
-        if isinstance(t, str):
-            return {"type": "text", "text": {"content": t}}
-        elif issubclass(t["type"], EmbedOrUploadBlock):
-            # always assumes external file url
-            return image_handler(t)
-        else:
-            return notion.BlockFactory().new_text_block(
-                t["title"],
-                **{
-                    "bold": t.get("_strong", False),
-                    "italic": t.get("_emphasis", False),
-                    "strikethrough": t.get("_strikethrough", False),
-                    "underline": t.get("_underline", False),
-                    "code": t.get("_code", False),
-                    "color": "default",
-                },
-            )
+        profiler = Profiler() if args.profile else None
+        _upload(
+            args.directory,
+            cfg,
+            force=args.force,
+            concurrency=args.concurrency,
+            parse_workers=args.parse_workers,
+            profiler=profiler,
+        )
+        if profiler:
+            profiler.write(args.profile)
+            logger.info(profiler.summary(args.profile_top))
+    elif args.subcommand == "watch":
+        with open(args.config, "r") as f:
+            cfg = config.load_config(f)
+        _watch(
+            args.directory,
+            cfg,
+            concurrency=args.concurrency,
+            parse_workers=args.parse_workers,
+            interval=args.interval,
+            debounce=args.debounce,
+        )
+
+
+def _configure_logging(verbose):
+    logging.basicConfig(format="%(message)s", level=logging.WARNING)
+    logging.getLogger("notionpub").setLevel(logging.DEBUG if verbose else logging.INFO)
+    if verbose > 1:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+
+def _upload(
+    dir: str,
+    cfg: config.ConfigFile,
+    force=False,
+    concurrency=CONCURRENCY,
+    parse_workers=None,
+    client: notion.NotionClient = None,
+    profiler: Profiler = None,
+):
+    dir = pathlib.Path(dir)
+    manifest = Manifest.load(cfg.manifest, dir)
+    paths = list(_glob(cfg.paths, dir))
+    hashes, changed = _changes(dir, manifest, paths, force)
+    removed = manifest.stale(p.as_posix() for p in paths)
+    if not force:
+        _check_not_empty(dir, paths, removed)
+    if not changed and not removed:
+        logger.info("nothing to publish, all files are unchanged")
+        return
+    client = client or notion.NotionClient(
+        os.getenv("NOTION_INTEGRATION_SECRET"), profiler=profiler
+    )
+    publisher = Publisher(dir, cfg, manifest, client, concurrency, parse_workers)
+    publisher.journal.retain(p.as_posix() for p in changed)
+    try:
+        publisher.publish(hashes, changed, removed, profiler)
+    finally:
+        publisher.close()
 
-    for child in children:
-        b = text_to_block(child)
-        if b is None:
-            continue
-        elif b["type"] == "text":
-            rich_text.append(b)
-        elif b["type"] == "image":
-            images.append(b)
-        else:
-            raise ValueError("unsupported paragraph child: " + b["type"])
-    return {"rich_text": rich_text, "children": images}
-
-
-class ChildrenAdapter:
-    def __init__(self, parent_id, client: notion.NotionClient) -> None:
-        self._parent_id = parent_id
-        self._client = client
-        self._blocks = []
-
-    def image_handler(self, image_block):
-        if image_block["source"].startswith("http"):
-            return {
-                "type": "image",
-                "image": {
-                    "type": "external",
-                    "external": {"url": image_block["source"]},
-                },
-            }
-        else:
-            return notion.BlockFactory().new_text_block(
-                "Image {} was not uploaded".format(image_block["source"]),
-                color="red",
-            )
 
-    def add_new(self, block_type, child_list_key=None, **kwargs):
+def _watch(
+    dir: str,
+    cfg: config.ConfigFile,
+    concurrency=CONCURRENCY,
+    parse_workers=None,
+    interval=watch.POLL_INTERVAL,
+    debounce=watch.DEBOUNCE,
+    client: notion.NotionClient = None,
+):
+    """
+    Publish the directory, then keep watching it, republishing files as they
+    change. The client, page index, directory pages and manifest stay in
+    memory, so publishing an edit costs about the same however big the tree is.
+    """
+    dir = pathlib.Path(dir)
+    watcher = watch.Watcher(lambda: _glob(cfg.paths, dir), dir, interval, debounce)
+    manifest = Manifest.load(cfg.manifest, dir)
+    changed = set(watcher.files)
+    removed = {pathlib.Path(p) for p in manifest.stale(p.as_posix() for p in changed)}
+    _check_not_empty(dir, changed, removed)
+    client = client or notion.NotionClient(os.getenv("NOTION_INTEGRATION_SECRET"))
+    publisher = Publisher(dir, cfg, manifest, client, concurrency, parse_workers)
+    publisher.journal.retain(p.as_posix() for p in changed)
+    logger.info("watching %s for changes", dir)
+    try:
+        while True:
+            hashes, edited = _changes(dir, manifest, sorted(changed))
+            gone = [p.as_posix() for p in sorted(removed) if manifest.get(p.as_posix())]
+            try:
+                # the files can also disappear while watching, e.g. when the
+                # directory is unmounted or a branch without it is checked out
+                _check_not_empty(dir, watcher.files, gone)
+            except ValueError as e:
+                logger.warning("%s", e)
+                gone = []
+            if edited or gone:
+                try:
+                    publisher.publish(hashes, edited, gone)
+                except Exception:
+                    logger.exception(
+                        "could not publish changes, retrying in %ds", WATCH_RETRY_DELAY
+                    )
+                    watcher.defer(changed, removed, WATCH_RETRY_DELAY)
+            changed, removed = watcher.changes()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.close()
+
+
+class Publisher:
+    """
+    Publishes files of an upload directory, keeping the client, child page
+    index, image uploads, journal and directory pages between calls to
+    `publish`, so each call only costs what the files it publishes need.
+    """
+
+    def __init__(
+        self,
+        dir: pathlib.Path,
+        cfg: config.ConfigFile,
+        manifest: Manifest,
+        client: notion.NotionClient,
+        concurrency=CONCURRENCY,
+        parse_workers=None,
+    ):
+        self.dir = dir
+        self.cfg = cfg
+        self.manifest = manifest
+        self.client = client
+        self.concurrency = concurrency
+        self.parse_workers = parse_workers
+        self.index = ChildPageIndex(
+            client, cfg.state_path("index.json") if cfg.cache_index else None
+        )
+        self.images = ImageUploader(client, cfg.state_path("images.json"))
+        self.journal = Journal.load(cfg.state_path("journal"))
+        self.dir_pages = {}
+
+    def publish(self, hashes, changed, removed, profiler: Profiler = None):
         """
-        Create a new block, add it as the last child of this parent block, and return the corresponding Block instance.
-        `block_type` can be either a type string, or a Block subclass.
+        Publish the `changed` files (paths relative to the directory, with
+        their `hashes`), and archive the pages of the `removed` ones.
         """
+        client, index, manifest = self.client, self.index, self.manifest
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                list(pool.map(lambda r: _archive(client, index, manifest, r), removed))
+                dirs, files = _tree(changed)
+                if () not in self.dir_pages:
+                    self.dir_pages[()] = client.get_page(self.cfg.root_page_id)
+                _upload_dirs(index, self.dir_pages, dirs, pool)
+                # markdown is converted on a process pool ahead of the upload
+                # workers, with at most `slots` converted files waiting for one
+                converted = parse.converted(
+                    [(self.dir / f, hashes[f]) for f in changed],
+                    parse.ParseCache(self.cfg.state_path("parse")),
+                    self.parse_workers,
+                )
+                slots = threading.BoundedSemaphore(2 * self.concurrency)
+                uploads = []
+                for filepath, (_, blocks, seconds) in zip(changed, converted):
+                    if profiler:
+                        profiler.add(filepath, "parse", seconds)
+                    slots.acquire()
+                    # each file's blocks are uploaded in order by a single worker
+                    upload = pool.submit(
+                        _upload_file,
+                        client,
+                        index,
+                        self.images,
+                        self.cfg,
+                        self.dir,
+                        filepath,
+                        self.dir_pages[filepath.parent.parts],
+                        manifest,
+                        self.journal,
+                        hashes[filepath],
+                        blocks,
+                        profiler,
+                    )
+                    upload.add_done_callback(lambda _: slots.release())
+                    uploads.append(upload)
+                for upload in uploads:
+                    upload.result()
+        finally:
+            self.images.forget_unattached()
+            self.images.save()
+            index.save()
 
-        # determine the block type string from the Block class, if that's what was provided
-        if (
-            isinstance(block_type, type)
-            and issubclass(block_type, Block)
-            and hasattr(block_type, "_type")
-        ):
-            block_type = block_type._type
-        elif not isinstance(block_type, str):
-            raise Exception(
-                "block_type must be a string or a Block subclass with a _type attribute"
-            )
+    def close(self):
+        self.journal.close()
+        self.images.close()
 
-        headers = {
-            "header": "heading_1",
-            "sub_header": "heading_2",
-            "sub_sub_header": "heading_3",
-        }
 
-        block_factory = notion.BlockFactory()
-        if block_type in headers.keys():
-            block_type = headers[block_type]
-            block_content = {
-                "object": "block",
-                "type": block_type,
-                block_type: {
-                    "rich_text": [block_factory.new_text_block(kwargs["title"])]
-                },
-            }
-        elif block_type == "text":
-            block_type = "paragraph"
-            block_content = {
-                "object": "block",
-                "type": block_type,
-                block_type: {
-                    "rich_text": [block_factory.new_text_block(kwargs["title"])]
-                },
-            }
-        elif block_type == "bulleted_list":
-            block_type = "bulleted_list_item"
-            block_content = {
-                "object": "block",
-                "type": block_type,
-                block_type: {
-                    "rich_text": [block_factory.new_text_block(kwargs["title"])]
-                },
-            }
-        elif block_type == "paragraph":
-            block_content = {
-                "object": "block",
-                "type": block_type,
-                block_type: paragraph_to_blocks(
-                    kwargs["rich_text"], self.image_handler
-                ),
-            }
-        elif block_type == "numbered_list":
-            block_type = "numbered_list_item"
-            block_content = {
-                "object": "block",
-                "type": block_type,
-                block_type: {
-                    "rich_text": [block_factory.new_text_block(kwargs["title"])]
-                },
-            }
-        else:
-            block_content = {
-                "object": "block",
-                "type": block_type,
-                block_type: kwargs,
-            }
-            print(block_content)
-            raise ValueError("unsupported block " + block_type)
-
-        response = self._client.create_block(
-            parent_id=self._parent_id, block=block_content
+def _check_not_empty(dir, paths, removed):
+    """
+    Refuse to archive every published page because no files matched, which is
+    far more likely a wrong directory or config than a deleted tree.
+    """
+    if removed and not paths:
+        raise ValueError(
+            "no files in '{}' match the config's paths; refusing to archive "
+            "the {} pages published from it (run `upload --force` to "
+            "archive them)".format(dir, len(removed))
         )
-        if "id" in response:
-            return PageAdapter(response, self._client)
-        if "results" in response:
-            return PageAdapter(response["results"][0], self._client)
-        print("other response", response)
-        return response
 
 
-class PageAdapter(UserDict):
-    def __init__(self, page, client):
-        self.page = page
-        self.children = ChildrenAdapter(page["id"], client)
-        super().__init__(page)
+def _changes(dir, manifest: Manifest, paths, force=False):
+    """hash `paths`, returning the hashes and the paths changed since the manifest"""
+    hashes = {p: file_hash(dir / p) for p in paths if (dir / p).exists()}
+    changed = [
+        p
+        for p, digest in hashes.items()
+        if force or not manifest.is_unchanged(p.as_posix(), digest)
+    ]
+    return hashes, changed
 
 
-def _upload(dir: str, cfg: config.ConfigFile):
-    dir = pathlib.Path(dir)
-    files = _glob(cfg.paths, dir)
-    client = notion.NotionClient(os.getenv("NOTION_INTEGRATION_SECRET"))
-    dirs, files = _tree(files)
-    parent = client.get_page(cfg.root_page_id)
-    dir_pages = {}
-    for dirname, subdir in dirs.items():
-        _upload_dir(client, parent, dirname, subdir, [], dir_pages)
-    for parent_parts, filepaths in files.items():
-        for filepath in filepaths:
-            parent_page_id = dir_pages[parent_parts]["id"]
-            child_pages = [
-                c
-                for c in client.get_children(parent_page_id)
-                if c["type"] == "child_page"
-            ]
-            try:
-                target_page = next(
-                    filter(
-                        lambda p: p["child_page"]["title"] == filepath.name, child_pages
-                    )
-                )
+def _archive(client: notion.NotionClient, index, manifest: Manifest, relpath):
+    page_id = manifest.get(relpath)["page_id"]
+    try:
+        client.archive_page(page_id)
+    except APIResponseError as e:
+        logger.warning("could not archive page for deleted file %s: %s", relpath, e)
+    index.remove(page_id)
+    manifest.remove(relpath)
+    manifest.save()
+
+
+def _upload_file(
+    client: notion.NotionClient,
+    index: ChildPageIndex,
+    images: ImageUploader,
+    cfg,
+    dir,
+    filepath,
+    parent,
+    manifest,
+    journal: Journal,
+    digest,
+    blocks,
+    profiler: Profiler = None,
+):
+    def stage(name):
+        if profiler is None:
+            return contextlib.nullcontext()
+        return profiler.stage(filepath, name)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("blocks for %s:\n%s", filepath, pprint.pformat(blocks))
+    relpath = filepath.as_posix()
+    target_page_id = index.get(parent["id"], filepath.name)
+    target_page = {"id": target_page_id} if target_page_id else None
+    with stage("upload"):
+        uploaded = images.upload_all(local_images(blocks), dir / filepath)
+        # an earlier run was interrupted while writing these contents
+        interrupted = journal.get(relpath, digest)
+        resumed = interrupted and _resume_page(client, interrupted)
+    if resumed:
+        done = interrupted["blocks"]
+        target_page = PageAdapter(resumed, client, buffered=True, images=uploaded)
+        with stage("convert"):
+            _render(dir / filepath, blocks, target_page)
+        with stage("upload"):
+            target_page.children.skip(done)
+            sent = _Sent(target_page)
+            target_page.children.flush(
+                confirm=lambda n, block: journal.confirm(relpath, done + n, block["id"])
+            )
+        logger.info("resumed %s after %d blocks", filepath, done)
+    elif target_page and cfg.update == "patch":
+        target_page = PageAdapter(target_page, client, buffered=True, images=uploaded)
+        with stage("convert"):
+            _render(dir / filepath, blocks, target_page)
+        with stage("upload"):
+            previous = manifest.get(relpath)
+            if previous and previous["page_id"] == target_page["id"]:
+                published = previous.get("children")
+                published_images = previous.get("images")
+            else:
+                published = published_images = None
+            sent = _Sent(target_page)
+            ops = patch.patch_page(client, target_page, published, published_images)
+        logger.info("patched %s: %s", filepath, dict(ops))
+    else:
+        with stage("upload"):
+            if target_page:
                 client.delete_block(target_page["id"])
-            except StopIteration:
-                continue
-            target_page = client.create_page(parent_page_id, filepath.name)
-            with open(dir / filepath, "r") as f:
-                target_page = PageAdapter(target_page, client)
-                for block in convert(f):
-                    md_upload_block(block, target_page, dir / filepath)
-
-
-def _upload_dir(client: notion.NotionClient, parent, dirname, subdir, parts, dir_pages):
-    child_pages = [
-        c for c in client.get_children(parent["id"]) if c["type"] == "child_page"
-    ]
+                index.remove(target_page["id"])
+            target_page = client.create_page(parent["id"], filepath.name)
+            index.add(parent["id"], filepath.name, target_page["id"])
+            journal.begin(relpath, digest, target_page["id"])
+        target_page = PageAdapter(target_page, client, buffered=True, images=uploaded)
+        with stage("convert"):
+            _render(dir / filepath, blocks, target_page)
+        with stage("upload"):
+            sent = _Sent(target_page)
+            target_page.children.flush(
+                confirm=lambda n, block: journal.confirm(relpath, n, block["id"])
+            )
+        logger.info("published %s", filepath)
+    images.attached(sent.file_upload_ids)
+    manifest.record(
+        relpath,
+        digest,
+        target_page["id"],
+        sent.children_digests(),
+        sent.image_uploads(),
+    )
+    manifest.save()
+    journal.finish(relpath)
+
+
+class _Sent:
+    """
+    The blocks buffered on a page, with the file uploads they reference, the
+    digests of their children and the uploaded images among their children,
+    taken before they are sent (which empties the buffers).
+    """
+
+    def __init__(self, page):
+        self.blocks = list(page.children._blocks)
+        self.file_upload_ids = file_upload_ids(b.payload() for b in self.blocks)
+        self._digests = [b.children_digest() for b in self.blocks]
+        self._images = [b.image_uploads() for b in self.blocks]
+
+    def children_digests(self):
+        """block id -> children digest, once the blocks have been sent"""
+        return self._by_id(self._digests)
+
+    def image_uploads(self):
+        """block id -> file upload ids of its image children, once the blocks have been sent"""
+        return self._by_id(self._images)
+
+    def _by_id(self, values):
+        return {
+            block["id"]: value
+            for block, value in zip(self.blocks, values)
+            if value and "id" in block
+        }
+
+
+def _resume_page(client: notion.NotionClient, entry):
+    """
+    Trim the page of an interrupted upload back to its last confirmed block,
+    deleting anything appended after it. Returns the page, or None if it can't
+    be resumed.
+    """
     try:
-        dir_page = next(
-            filter(lambda p: p["child_page"]["title"] == dirname, child_pages)
+        page = client.get_page(entry["page_id"])
+    except APIResponseError:
+        return None
+    if page.get("archived") or page.get("in_trash"):
+        return None
+    children = [child["id"] for child in client.iter_children(page["id"])]
+    confirmed = children[: entry["blocks"]]
+    if len(confirmed) < entry["blocks"] or confirmed[-1:] != (
+        [entry["block_id"]] if entry["block_id"] else []
+    ):
+        # the page was changed since, so the journal can't be trusted
+        return None
+    for block_id in children[entry["blocks"] :]:
+        client.delete_block(block_id)
+    return {"id": page["id"]}
+
+
+def _render(filepath, blocks, page):
+    """add a markdown file's converted blocks to a (buffered) page"""
+    from md2notion.upload import uploadBlock as md_upload_block
+
+    for block in blocks:
+        md_upload_block(block, page, filepath)
+
+
+def _upload_dirs(index: ChildPageIndex, dir_pages, dirs, pool):
+    """
+    Find or create the page for every directory in the `dirs` trie that isn't
+    in `dir_pages` yet, one level at a time, with the directories of each level
+    handled in parallel. `dir_pages` maps directory parts to page, starting
+    with the root page at `()`, and is updated in place.
+    """
+    level = [((dirname,), subdir) for dirname, subdir in dirs.items()]
+    while level:
+        missing = [d for d in level if d[0] not in dir_pages]
+        pages = pool.map(
+            lambda d: _upload_dir(index, dir_pages[d[0][:-1]], d[0][-1]), missing
         )
-    except StopIteration:
-        dir_page = client.create_page(parent["id"], dirname)
-    p = parts + [dirname]
-    dir_pages[tuple(p)] = dir_page
-    for dirname, subdir in subdir.items():
-        _upload_dir(client, dir_page, dirname, subdir, p, dir_pages)
+        for (parts, _), dir_page in zip(missing, pages):
+            dir_pages[parts] = dir_page
+        level = [
+            (parts + (name,), sub)
+            for parts, subdir in level
+            for name, sub in subdir.items()
+        ]
+    return dir_pages
+
+
+def _upload_dir(index: ChildPageIndex, parent, dirname):
+    return {"id": index.find_or_create(parent["id"], dirname)}
 
 
 def _glob(paths, root):
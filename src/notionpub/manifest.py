@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import pathlib
+import threading
+
+VERSION = 2
+
+
+class Manifest:
+    """
+    Records what was last published for each file: a hash of the file contents
+    and the id of the page it was published to. Entries are kept per upload
+    directory and keyed by the file's path relative to it, so publishing
+    another directory with the same config never touches (or archives) this
+    one's pages. Safe to share between threads.
+    """
+
+    def __init__(self, path, directory=".", directories=None):
+        self.path = path
+        self.directory = _directory_key(path, directory)
+        self._directories = directories or {}
+        self._entries = self._directories.setdefault(self.directory, {})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, directory="."):
+        """the manifest at `path`, with the entries of upload directory `directory`"""
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(path, directory)
+        if not isinstance(data.get("version"), int):
+            # a manifest from before entries were kept per directory: assume
+            # it was written for this one
+            data = {"directories": {_directory_key(path, directory): data}}
+        return cls(path, directory, data["directories"])
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with self._lock:
+            with open(tmp, "w") as f:
+                json.dump(
+                    {"version": VERSION, "directories": self._directories},
+                    f,
+                    indent=2,
+                    sort_keys=True,
+                )
+            os.replace(tmp, self.path)
+
+    def get(self, relpath):
+        return self._entries.get(relpath)
+
+    def is_unchanged(self, relpath, digest):
+        entry = self.get(relpath)
+        return entry is not None and entry["hash"] == digest
+
+    def record(self, relpath, digest, page_id, children=None, images=None):
+        """
+        Record a published file. `children` maps the ids of the page's blocks
+        that have children to a digest of those children, and `images` maps
+        the ids of blocks with uploaded images among their children to the
+        file upload ids of those images, in order.
+        """
+        entry = {"hash": digest, "page_id": page_id}
+        if children:
+            entry["children"] = children
+        if images:
+            entry["images"] = images
+        with self._lock:
+            self._entries[relpath] = entry
+
+    def remove(self, relpath):
+        with self._lock:
+            self._entries.pop(relpath, None)
+
+    def stale(self, relpaths):
+        """paths in the manifest that are not in `relpaths`"""
+        return sorted(set(self._entries) - set(relpaths))
+
+
+def _directory_key(path, directory):
+    """`directory` relative to the manifest's own, so the key survives moving both"""
+    manifest_dir = os.path.dirname(os.path.abspath(path))
+    return pathlib.Path(
+        os.path.relpath(os.path.abspath(directory), manifest_dir)
+    ).as_posix()
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
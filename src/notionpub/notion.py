@@ -1,19 +1,135 @@
+import itertools
+import mimetypes
+import os
+import time
+
+import httpx
 from notion_client import Client
-from notion.client import NotionClient as OldClient
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+
+from notionpub.profile import Profiler
+from notionpub.ratelimit import TokenBucket
+
+# limits on a single `blocks.children.append` request
+# https://developers.notion.com/reference/request-limits
+MAX_CHILDREN = 100
+MAX_NESTING = 2
+MAX_BLOCKS_PER_REQUEST = 1000
+# size of a request body, as sent (JSON with non-ASCII characters escaped)
+MAX_PAYLOAD_BYTES = 500 * 1000
+
+# largest file that can be sent in a single-part file upload
+# https://developers.notion.com/reference/file-upload
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+
+
+# how many times a rate-limited (429) request is retried before giving up
+MAX_RETRIES = 5
+
+
+class RateLimitedClient(Client):
+    """
+    A notion_client.Client whose requests all go through a shared TokenBucket,
+    retrying 429 responses after the `Retry-After` the API asks for.
+    With a `profiler`, every response and retry is recorded in it.
+    Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        limiter: TokenBucket,
+        max_retries=MAX_RETRIES,
+        profiler: Profiler = None,
+        **kwargs
+    ):
+        super().__init__(**kwargs)
+        self._limiter = limiter
+        self._max_retries = max_retries
+        self._profiler = profiler
+
+    def request(self, path, method, query=None, body=None, auth=None):
+        return self._retrying(
+            lambda: super(RateLimitedClient, self).request(
+                path, method, query, body, auth
+            )
+        )
+
+    def send_file(self, file_upload_id, filename, file, content_type):
+        """send the contents of a file object for a single-part file upload"""
+
+        def send():
+            file.seek(0)
+            request = self.client.build_request(
+                "POST",
+                "file_uploads/{}/send".format(file_upload_id),
+                files={"file": (filename, file, content_type)},
+            )
+            try:
+                response = self.client.send(request)
+            except httpx.TimeoutException:
+                raise RequestTimeoutError()
+            return self._parse_response(response)
+
+        return self._retrying(send)
+
+    def _parse_response(self, response):
+        if self._profiler is not None:
+            self._profiler.request(
+                response.request.method,
+                response.request.url.path,
+                response.status_code,
+                response.elapsed.total_seconds(),
+                int(response.request.headers.get("Content-Length", 0)),
+                len(response.content),
+            )
+        return super()._parse_response(response)
+
+    def _retrying(self, send):
+        for attempt in itertools.count():
+            if self._profiler is not None:
+                start = time.perf_counter()
+                self._limiter.acquire()
+                self._profiler.waited(time.perf_counter() - start)
+            else:
+                self._limiter.acquire()
+            try:
+                return send()
+            except HTTPResponseError as e:
+                if e.status != 429 or attempt >= self._max_retries:
+                    raise
+                if self._profiler is not None:
+                    self._profiler.retry()
+                self._limiter.pause(float(e.headers.get("Retry-After", 1)))
 
 
 class NotionClient:
-    def __init__(self, token):
+    def __init__(self, token, limiter=None, base_url=None, profiler=None):
         if not token:
             raise ValueError("Notion API token must be provided")
-        self._client = Client(auth=token)
-        self._other = OldClient(token_v2=token)
+        options = {"base_url": base_url} if base_url else {}
+        self._client = RateLimitedClient(
+            limiter or TokenBucket(), profiler=profiler, auth=token, **options
+        )
+        self._token = token
+        self._legacy = None
+
+    @property
+    def _other(self):
+        """the notion-py client, which is only created (and imported) when first used"""
+        if self._legacy is None:
+            from notion.client import NotionClient as OldClient
+
+            self._legacy = OldClient(token_v2=self._token)
+        return self._legacy
 
     def get_page(self, page_id) -> dict:
         return self._client.pages.retrieve(page_id)
 
+    def get_block(self, block_id) -> dict:
+        return self._client.blocks.retrieve(block_id)
+
     def get_children(self, block_id) -> list:
-        return self._client.blocks.children.list(block_id)["results"]
+        return list(self.iter_children(block_id))
 
     def create_page(self, parent_id, name):
         return self._client.pages.create(
@@ -35,6 +151,9 @@ class NotionClient:
             }
         )
 
+    def archive_page(self, page_id):
+        return self._client.pages.update(page_id, archived=True)
+
     def clear_page(self, page_id):
         children = self.get_children(page_id)
         for child in children:
@@ -46,6 +165,41 @@ class NotionClient:
     def create_block(self, parent_id, block):
         return self._client.blocks.children.append(parent_id, children=[block])
 
+    def append_blocks(self, parent_id, blocks, after=None) -> list:
+        kwargs = {"after": after} if after else {}
+        return self._client.blocks.children.append(
+            parent_id, children=blocks, **kwargs
+        )["results"]
+
+    def iter_children(self, block_id):
+        """all children of a block, following pagination"""
+        cursor = None
+        while True:
+            kwargs = {"start_cursor": cursor} if cursor else {}
+            response = self._client.blocks.children.list(
+                block_id, page_size=MAX_CHILDREN, **kwargs
+            )
+            yield from response["results"]
+            if not response.get("has_more"):
+                return
+            cursor = response["next_cursor"]
+
+    def update_block(self, block_id, block_type, content):
+        return self._client.blocks.update(block_id, **{block_type: content})
+
+    def upload_file(self, path) -> str:
+        """upload a local file with the file upload API, returning its id"""
+        filename = os.path.basename(path)
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        file_upload = self._client.request(
+            path="file_uploads",
+            method="POST",
+            body={"filename": filename, "content_type": content_type},
+        )
+        with open(path, "rb") as f:
+            self._client.send_file(file_upload["id"], filename, f, content_type)
+        return file_upload["id"]
+
 
 class BlockFactory:
     def __init__(self):
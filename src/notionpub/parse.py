@@ -0,0 +1,107 @@
+import collections
+import hashlib
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# md2notion, mistletoe and notion-py take a noticeable part of a second to
+# import, so they are only imported once a file actually needs converting
+
+
+class ParseCache:
+    """
+    An on-disk cache of converted block descriptors, keyed by the hash of a
+    file's contents, the renderer class and the mistletoe version, so a file
+    is never parsed twice with the same renderer.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def key(self, digest):
+        import mistletoe
+        from md2notion.NotionPyRenderer import NotionPyRenderer
+
+        renderer_id = "{}.{} mistletoe-{}".format(
+            NotionPyRenderer.__module__,
+            NotionPyRenderer.__qualname__,
+            mistletoe.__version__,
+        )
+        return hashlib.sha256("{}:{}".format(digest, renderer_id).encode()).hexdigest()
+
+    def contains(self, key):
+        return os.path.exists(self._file(key))
+
+    def get(self, key):
+        try:
+            with open(self._file(key), "rb") as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, key, blocks):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = "{}.{}.tmp".format(self._file(key), os.getpid())
+        with open(tmp, "wb") as f:
+            pickle.dump(blocks, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._file(key))
+
+    def _file(self, key):
+        return os.path.join(self.path, key + ".pickle")
+
+
+def convert_file(path, cache: ParseCache = None, key=None):
+    """convert a markdown file to block descriptors, storing them in `cache`"""
+    from md2notion.upload import convert
+
+    with open(path, "r") as f:
+        blocks = convert(f)
+    if cache is not None:
+        cache.put(key, blocks)
+    return blocks
+
+
+def _timed_convert_file(*args):
+    start = time.perf_counter()
+    blocks = convert_file(*args)
+    return blocks, time.perf_counter() - start
+
+
+def converted(files, cache: ParseCache, workers=None, ahead=None):
+    """
+    Yield (path, blocks, seconds) for each (path, digest) in `files`, in
+    order, where `seconds` is the time spent converting the file or loading it
+    from the cache. Files not in the cache are converted on a pool of `workers`
+    processes, at most `ahead` files ahead of the consumer.
+    """
+    jobs = [(path, cache.key(digest)) for path, digest in files]
+    misses = sum(not cache.contains(key) for _, key in jobs)
+    workers = min(workers or os.cpu_count() or 1, misses)
+
+    def result(path, key, future=None):
+        if future:
+            return (path, *future.result())
+        start = time.perf_counter()
+        blocks = cache.get(key)
+        if blocks is None:
+            blocks = convert_file(path, cache, key)
+        return path, blocks, time.perf_counter() - start
+
+    if workers <= 1:
+        for path, key in jobs:
+            yield result(path, key)
+        return
+
+    ahead = ahead or 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        for path, key in jobs:
+            future = None
+            if not cache.contains(key):
+                future = pool.submit(_timed_convert_file, path, cache, key)
+            pending.append((path, key, future))
+            if len(pending) > ahead:
+                yield result(*pending.popleft())
+        while pending:
+            yield result(*pending.popleft())
@@ -0,0 +1,194 @@
+import difflib
+import json
+from collections import Counter
+
+from notionpub import notion
+from notionpub.blocks import ChildrenAdapter, PendingBlock
+
+# block types whose content can be changed in place with `blocks.update`
+UPDATABLE = {
+    "paragraph",
+    "heading_1",
+    "heading_2",
+    "heading_3",
+    "bulleted_list_item",
+    "numbered_list_item",
+}
+
+_DEFAULT_ANNOTATIONS = {
+    "bold": False,
+    "italic": False,
+    "strikethrough": False,
+    "underline": False,
+    "code": False,
+    "color": "default",
+}
+
+
+def patch_page(client: notion.NotionClient, page, published=None, images=None):
+    """
+    Bring the children of an existing page in line with the blocks buffered on
+    `page` (a buffered PageAdapter), keeping unchanged blocks, updating changed
+    ones in place, and only inserting or deleting what's left.
+    `published` maps the ids of the page's blocks to the `children_digest` they
+    were last published with; the children of those blocks are only listed
+    and patched if their digest changed. `images` maps the ids of the page's
+    blocks to the file upload ids of the images among their children, as
+    last published, which the API returns as "file" images with a new url.
+    Returns a Counter of the operations performed.
+    """
+    ops = Counter()
+    existing = list(client.iter_children(page["id"]))
+    _patch_children(
+        client,
+        page["id"],
+        existing,
+        page.children._blocks,
+        ops,
+        published or {},
+        images or {},
+    )
+    page.children._blocks = []
+    return ops
+
+
+def _patch_children(
+    client, parent_id, existing, new, ops, published=None, images=None, uploads=None
+):
+    matcher = difflib.SequenceMatcher(
+        None,
+        _existing_keys(existing, uploads),
+        [_content_key(b.content) for b in new],
+        autojunk=False,
+    )
+    inserts = []  # (anchor block id, [PendingBlock]), in page order
+    deletes, updates, kept = [], [], []
+    anchor = None
+
+    def insert(block):
+        if inserts and inserts[-1][0] == anchor:
+            inserts[-1][1].append(block)
+        else:
+            inserts.append((anchor, [block]))
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        old, cur = existing[i1:i2], new[j1:j2]
+        if tag == "equal":
+            kept.extend(zip(old, cur))
+            anchor = old[-1]["id"]
+            continue
+        for k in range(max(len(old), len(cur))):
+            o = old[k] if k < len(old) else None
+            c = cur[k] if k < len(cur) else None
+            if (
+                o is not None
+                and c is not None
+                and o["type"] == c.content["type"]
+                and o["type"] in UPDATABLE
+            ):
+                updates.append((o, c))
+                anchor = o["id"]
+                continue
+            if o is not None:
+                deletes.append(o)
+            if c is not None:
+                insert(c)
+
+    if inserts and inserts[0][0] is None and (kept or updates):
+        # the API can only insert *after* an existing block, so new blocks at
+        # the top of the list mean re-appending everything
+        deletes = existing
+        inserts = [(None, list(new))]
+        kept, updates = [], []
+
+    for o, c in updates:
+        block_type = o["type"]
+        content = {k: v for k, v in c.content[block_type].items() if k != "children"}
+        client.update_block(o["id"], block_type, content)
+        ops["update"] += 1
+    for o, c in kept + updates:
+        # the patched block takes the place of the existing one
+        c["id"] = o["id"]
+        if published and o["id"] in published:
+            if published[o["id"]] == c.children_digest():
+                ops["keep children"] += 1
+                continue
+        if o.get("has_children") or _new_children(c):
+            children = (
+                list(client.iter_children(o["id"])) if o.get("has_children") else []
+            )
+            _patch_children(
+                client,
+                o["id"],
+                children,
+                _new_children(c),
+                ops,
+                uploads=images and images.get(o["id"]),
+            )
+    ops["keep"] += len(kept)
+    for o in deletes:
+        client.delete_block(o["id"])
+        ops["delete"] += 1
+    for after, blocks in inserts:
+        adapter = ChildrenAdapter(parent_id, client, buffered=True)
+        adapter._blocks = blocks
+        adapter.flush(after=after)
+        ops["insert"] += len(blocks)
+
+
+def _new_children(block):
+    static = [PendingBlock(c, block.children._client) for c in block._static_children()]
+    return static + block.children._blocks
+
+
+def _existing_keys(blocks, uploads=None):
+    """
+    The content keys of existing blocks. `uploads` are the file upload ids of
+    the uploaded images among them, in order, as published; if there are as
+    many "file" images, each is keyed by its upload, so it matches the block
+    that attaches it again.
+    """
+    keys = [_content_key(b) for b in blocks]
+    files = [
+        i
+        for i, b in enumerate(blocks)
+        if b["type"] == "image" and b["image"].get("type") == "file"
+    ]
+    if uploads and len(uploads) == len(files):
+        for i, file_upload_id in zip(files, uploads):
+            keys[i] = "image", "file_upload", file_upload_id
+    return keys
+
+
+def _content_key(block):
+    """a hashable summary of a block's own content, ignoring its children"""
+    block_type = block["type"]
+    content = block[block_type]
+    if "rich_text" in content:
+        return block_type, _rich_text_key(content["rich_text"])
+    if content.get("type") in ("external", "file", "file_upload"):
+        # uploaded files come back as "file" blocks with a fresh signed url,
+        # so on their own these never compare equal (see `_existing_keys`)
+        source = content[content["type"]]
+        return block_type, content["type"], source.get("url", source.get("id"))
+    return block_type, json.dumps(
+        {k: v for k, v in content.items() if k != "children"}, sort_keys=True
+    )
+
+
+def _rich_text_key(rich_text):
+    # notion may split or merge runs of text, so compare merged runs
+    runs = []
+    for t in rich_text:
+        text = t.get("text", {})
+        link = (text.get("link") or {}).get("url")
+        style = (
+            link,
+            tuple(sorted({**_DEFAULT_ANNOTATIONS, **t.get("annotations", {})}.items())),
+        )
+        content = text.get("content", t.get("plain_text", ""))
+        if runs and runs[-1][1] == style:
+            runs[-1][0] += content
+        elif content:
+            runs.append([content, style])
+    return tuple((content, style) for content, style in runs)
@@ -0,0 +1,168 @@
+import collections
+import contextlib
+import json
+import re
+import threading
+import time
+
+# upper bounds, in seconds, of the request latency histogram's buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# number of files listed in the slowest-files summary
+TOP_FILES = 10
+
+STAGES = ("parse", "convert", "upload")
+
+_ID = re.compile(r"[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}")
+
+
+class Profiler:
+    """
+    Collects per-endpoint request statistics from a RateLimitedClient, and the
+    time each file spends in each stage of a publish. Safe to share between
+    threads.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._started = clock()
+        self._lock = threading.Lock()
+        self._endpoints = collections.defaultdict(_Endpoint)
+        self._files = collections.defaultdict(lambda: dict.fromkeys(STAGES, 0.0))
+        self.retries = 0
+        self.throttled = 0.0
+
+    def request(self, method, path, status, seconds, sent, received):
+        """record one HTTP response"""
+        endpoint = "{} {}".format(method, _ID.sub("{id}", path))
+        with self._lock:
+            self._endpoints[endpoint].add(status, seconds, sent, received)
+
+    def retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def waited(self, seconds):
+        """record time spent waiting on the rate limiter"""
+        with self._lock:
+            self.throttled += seconds
+
+    def add(self, path, stage, seconds):
+        with self._lock:
+            self._files[str(path)][stage] += seconds
+
+    @contextlib.contextmanager
+    def stage(self, path, stage):
+        """time the body of the `with` statement as `stage` of file `path`"""
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.add(path, stage, self._clock() - start)
+
+    def report(self):
+        with self._lock:
+            endpoints = {
+                name: endpoint.as_dict()
+                for name, endpoint in sorted(self._endpoints.items())
+            }
+            files = sorted(
+                (
+                    {"path": path, **stages, "total": sum(stages.values())}
+                    for path, stages in self._files.items()
+                ),
+                key=lambda f: f["total"],
+                reverse=True,
+            )
+            return {
+                "wall_time": self._clock() - self._started,
+                "requests": {
+                    "count": sum(e["count"] for e in endpoints.values()),
+                    "rate_limited": sum(e["rate_limited"] for e in endpoints.values()),
+                    "retries": self.retries,
+                    "throttled_time": self.throttled,
+                    "bytes_sent": sum(e["bytes_sent"] for e in endpoints.values()),
+                    "bytes_received": sum(
+                        e["bytes_received"] for e in endpoints.values()
+                    ),
+                },
+                "endpoints": endpoints,
+                "stages": {s: sum(f[s] for f in files) for s in STAGES},
+                "files": files,
+            }
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def summary(self, top=TOP_FILES):
+        """a human readable summary of the report, with the `top` slowest files"""
+        report = self.report()
+        requests = report["requests"]
+        lines = [
+            "{:.2f}s, {} requests ({} rate limited, {} retried), "
+            "{:.2f}s waiting on the rate limiter".format(
+                report["wall_time"],
+                requests["count"],
+                requests["rate_limited"],
+                requests["retries"],
+                requests["throttled_time"],
+            ),
+            "stages: "
+            + ", ".join("{} {:.2f}s".format(s, t) for s, t in report["stages"].items()),
+        ]
+        for name, endpoint in report["endpoints"].items():
+            lines.append(
+                "  {:<40} {:>6} requests, {:8.3f}s mean".format(
+                    name, endpoint["count"], endpoint["mean_time"]
+                )
+            )
+        if report["files"]:
+            lines.append("slowest files:")
+        for f in report["files"][:top]:
+            lines.append(
+                "  {total:8.2f}s  {path} (parse {parse:.2f}s, convert {convert:.2f}s, "
+                "upload {upload:.2f}s)".format(**f)
+            )
+        return "\n".join(lines)
+
+
+class _Endpoint:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.sent = 0
+        self.received = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, status, seconds, sent, received):
+        self.count += 1
+        self.errors += status >= 400
+        self.rate_limited += status == 429
+        self.total_time += seconds
+        self.max_time = max(self.max_time, seconds)
+        self.sent += sent
+        self.received += received
+        bucket = next(
+            (i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound),
+            len(LATENCY_BUCKETS),
+        )
+        self.histogram[bucket] += 1
+
+    def as_dict(self):
+        labels = ["<={}s".format(b) for b in LATENCY_BUCKETS]
+        labels.append(">{}s".format(LATENCY_BUCKETS[-1]))
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "total_time": self.total_time,
+            "mean_time": self.total_time / self.count,
+            "max_time": self.max_time,
+            "bytes_sent": self.sent,
+            "bytes_received": self.received,
+            "latency_histogram": dict(zip(labels, self.histogram)),
+        }
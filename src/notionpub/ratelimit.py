@@ -0,0 +1,52 @@
+import threading
+import time
+
+# https://developers.notion.com/reference/request-limits
+# "an average of three requests per second. Some bursts beyond the average
+# rate are allowed."
+RATE = 3
+BURST = 10
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket allowing `rate` requests per second on average,
+    and up to `burst` requests at once.
+    """
+
+    def __init__(self, rate=RATE, burst=BURST, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._updated = clock()
+        self._paused_until = 0
+
+    def acquire(self):
+        """block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = self._clock()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(
+                        self.burst, self._tokens + (now - self._updated) * self.rate
+                    )
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+    def pause(self, seconds):
+        """hold back every caller for `seconds`, e.g. after a 429's Retry-After"""
+        with self._lock:
+            now = self._clock()
+            self._paused_until = max(self._paused_until, now + seconds)
+            # start refilling from empty once the pause is over
+            self._tokens = 0
+            self._updated = self._paused_until
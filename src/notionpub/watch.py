@@ -0,0 +1,82 @@
+import os
+import time
+
+# seconds between two scans of the watched files
+POLL_INTERVAL = 1.0
+# seconds the files must stay unchanged before a batch of changes is published
+DEBOUNCE = 2.0
+
+
+class Watcher:
+    """
+    Watches a set of files for changes by polling their modification time and
+    size, which works the same on every platform and file system.
+    `list_files` returns the paths to watch, relative to `root`; it is called
+    on every poll, so new files are picked up as they appear.
+    """
+
+    def __init__(
+        self,
+        list_files,
+        root,
+        interval=POLL_INTERVAL,
+        debounce=DEBOUNCE,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self._list_files = list_files
+        self._root = root
+        self.interval = interval
+        self.debounce = debounce
+        self._clock = clock
+        self._sleep = sleep
+        self.files = self._scan()
+        self._changed = set()
+        self._removed = set()
+        self._last_change = None
+        self._not_before = 0
+
+    def changes(self):
+        """
+        Block until some files have changed, and then until they have stayed
+        unchanged for `debounce` seconds. Returns the (changed, removed) paths.
+        """
+        while True:
+            self._sleep(self.interval)
+            self._poll()
+            now = self._clock()
+            if (
+                (self._changed or self._removed)
+                and now - self._last_change >= self.debounce
+                and now >= self._not_before
+            ):
+                changed, removed = self._changed, self._removed
+                self._changed, self._removed = set(), set()
+                return changed, removed
+
+    def defer(self, changed, removed, delay):
+        """return `changed` and `removed` again with the next changes, in `delay` seconds at the earliest"""
+        self._changed |= set(changed) - self._removed
+        self._removed |= set(removed) - self._changed
+        self._last_change = self._last_change or self._clock()
+        self._not_before = self._clock() + delay
+
+    def _poll(self):
+        files = self._scan()
+        changed = {p for p, stat in files.items() if self.files.get(p) != stat}
+        removed = set(self.files) - set(files)
+        if changed or removed:
+            self._changed = (self._changed - removed) | changed
+            self._removed = (self._removed - changed) | removed
+            self._last_change = self._clock()
+        self.files = files
+
+    def _scan(self):
+        files = {}
+        for path in self._list_files():
+            try:
+                stat = os.stat(os.path.join(self._root, path))
+            except FileNotFoundError:
+                continue
+            files[path] = (stat.st_mtime_ns, stat.st_size)
+        return files
@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pytest
+
+from notionpub import config, main, notion
+from notionpub.manifest import Manifest
+from notionpub.ratelimit import TokenBucket
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks")
+)
+
+from fake_notion import FakeNotionServer  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    server = FakeNotionServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def other_server():
+    server = FakeNotionServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def publish(tmp_path, server):
+    """
+    A function that writes `files` (a dict of relative path to contents) to a
+    directory and uploads it to `server` (or the `fake` server given), with
+    `force` and any config `options` set, returning a dict of relative path to page id.
+    Each call with the same `name` publishes the same directory, with the
+    same config and manifest.
+    """
+
+    def publish(files, name="docs", fake=None, force=False, **options):
+        fake = fake or server
+        directory = tmp_path / name
+        for relpath, contents in files.items():
+            path = directory / relpath
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(contents)
+        config_path = directory / "notionpub.yaml"
+        config_path.write_text(
+            "root_page_id: '{}'\npaths:\n  - '**/*.md'\n".format(fake.root_page_id)
+        )
+        with open(config_path) as f:
+            cfg = config.load_config(f)
+        for key, value in options.items():
+            setattr(cfg, key, value)
+        client = notion.NotionClient(
+            "secret_test", TokenBucket(rate=1000, burst=1000), base_url=fake.url
+        )
+        main._upload(
+            directory, cfg, force, client=client, concurrency=1, parse_workers=1
+        )
+        manifest = Manifest.load(cfg.manifest, directory)
+        return {relpath: manifest.get(relpath)["page_id"] for relpath in files}
+
+    return publish
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+from notion_client import APIResponseError
+
+from fake_notion import NotionError
+
+DOC = "# Doc\n\n![an image](image.png)\n"
+
+
+def test_upload_is_kept_once_attached(publish, server, tmp_path, monkeypatch):
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "image.png").write_bytes(b"\x89PNG\r\n\x1a\n")
+
+    def reject(id, query, body):
+        raise NotionError(400, "validation_error", "rejected")
+
+    with monkeypatch.context() as m:
+        m.setattr(server.notion, "blocks_children_append", reject)
+        with pytest.raises(APIResponseError):
+            publish({"doc.md": DOC})
+    # the upload was never attached, so it must not be reused
+    assert _kept(tmp_path) == {}
+
+    publish({"doc.md": DOC})
+    kept = _kept(tmp_path)
+    assert len(kept) == 1
+    assert _uploads(server) == 2
+
+    publish({"doc.md": DOC + "\nMore text.\n"})
+    assert _kept(tmp_path) == kept
+    assert _uploads(server) == 2
+
+
+def test_unchanged_images_are_kept(publish, server, tmp_path):
+    images = tmp_path / "docs"
+    images.mkdir()
+    (images / "a.png").write_bytes(b"\x89PNG a")
+    (images / "b.png").write_bytes(b"\x89PNG b")
+    doc = "# Doc\n\nTwo images: ![a](a.png) ![b](b.png)\n"
+    page_id = publish({"doc.md": doc})["doc.md"]
+    (paragraph_id,) = [
+        b for b in server.notion.children[page_id] if _type(server, b) == "paragraph"
+    ]
+    a, b = server.notion.children[paragraph_id]
+
+    (images / "b.png").write_bytes(b"\x89PNG b, edited")
+    server.stats.__init__()
+    publish({"doc.md": doc.replace("Two images", "Two images, one edited")})
+    requests = server.stats.as_dict()["requests_by_endpoint"]
+    # the API returns attached uploads as "file" images with a new url, but
+    # the unchanged image is still kept
+    assert requests["blocks.delete"] == 1
+    assert requests["blocks.children.append"] == 1
+    kept, added = server.notion.children[paragraph_id]
+    assert kept == a
+    assert not server.notion.blocks[a]["archived"]
+    assert server.notion.blocks[b]["archived"]
+    assert server.notion.blocks[added]["image"]["type"] == "file"
+
+
+def test_unreadable_cache_is_ignored(publish, server, tmp_path):
+    state = tmp_path / "docs" / ".notionpub"
+    state.mkdir(parents=True)
+    (tmp_path / "docs" / "image.png").write_bytes(b"\x89PNG\r\n\x1a\n")
+    # e.g. a run killed while it was writing the cache
+    (state / "images.json").write_text('{"0123')
+
+    publish({"doc.md": DOC})
+    assert len(_kept(tmp_path)) == 1
+    assert _uploads(server) == 1
+    assert not (state / "images.json.tmp").exists()
+
+
+def _type(server, block_id):
+    return server.notion.blocks[block_id]["type"]
+
+
+def _kept(tmp_path):
+    try:
+        with open(tmp_path / "docs" / ".notionpub" / "images.json") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _uploads(server):
+    return server.stats.as_dict()["requests_by_endpoint"].get("file_uploads.create", 0)
@@ -0,0 +1,14 @@
+import json
+
+
+def test_unreadable_index_is_ignored(publish, server, tmp_path):
+    state = tmp_path / "docs" / ".notionpub"
+    state.mkdir(parents=True)
+    # e.g. a run killed while it was writing the index
+    (state / "index.json").write_text('{"0123')
+
+    pages = publish({"doc.md": "# Doc\n"}, cache_index=True)
+    with open(state / "index.json") as f:
+        index = json.load(f)
+    assert index[server.root_page_id]["pages"] == {"doc.md": pages["doc.md"]}
+    assert not (state / "index.json.tmp").exists()
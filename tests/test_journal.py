@@ -0,0 +1,131 @@
+import json
+
+import pytest
+from notion_client import APIResponseError
+
+from fake_notion import NotionError
+from notionpub.journal import Journal
+
+# three batches of top-level blocks
+DOC = "# Doc\n\n" + "\n\n".join("Paragraph {}.".format(i) for i in range(250)) + "\n"
+
+
+@pytest.fixture
+def interrupted(publish, server, tmp_path, monkeypatch):
+    """
+    A function that publishes `files`, failing the `fail`th append request,
+    and returns the id of the page that was being written.
+    """
+
+    def interrupted(files, fail=2):
+        calls = []
+        append = server.notion.blocks_children_append
+
+        def flaky(id, query, body):
+            calls.append(id)
+            if len(calls) == fail:
+                raise NotionError(500, "internal_server_error", "something went wrong")
+            return append(id, query, body)
+
+        with monkeypatch.context() as m:
+            m.setattr(server.notion, "blocks_children_append", flaky)
+            with pytest.raises(APIResponseError):
+                publish(files)
+        return _entries(tmp_path)["doc.md"]["page_id"]
+
+    return interrupted
+
+
+def test_resumes_after_failed_batch(publish, interrupted, server, other_server):
+    page_id = interrupted({"doc.md": DOC})
+    assert len(server.notion.children[page_id]) == 100
+
+    server.stats.__init__()
+    pages = publish({"doc.md": DOC})
+    requests = server.stats.as_dict()["requests_by_endpoint"]
+    assert pages["doc.md"] == page_id
+    assert "pages.create" not in requests
+    # only the two batches that weren't confirmed are appended
+    assert requests["blocks.children.append"] == 2
+    assert _content(server, page_id) == _reference(publish, other_server, DOC)
+
+
+def test_appended_blocks_after_the_last_confirmed_one_are_trimmed(
+    publish, interrupted, server, other_server
+):
+    page_id = interrupted({"doc.md": DOC})
+    # e.g. a batch that was appended, but whose response never arrived
+    server.notion.blocks_children_append(
+        page_id, {}, {"children": [_paragraph("Paragraph 100.")]}
+    )
+
+    publish({"doc.md": DOC})
+    assert _content(server, page_id) == _reference(publish, other_server, DOC)
+
+
+@pytest.mark.parametrize("change", ["deleted", "edited"])
+def test_page_changed_since_the_crash_is_not_resumed(
+    publish, interrupted, server, other_server, change
+):
+    page_id = interrupted({"doc.md": DOC})
+    if change == "deleted":
+        server.notion.pages_update(page_id, {}, {"archived": True})
+    else:
+        server.notion.blocks_delete(server.notion.children[page_id][0], {}, {})
+
+    pages = publish({"doc.md": DOC})
+    assert _content(server, pages["doc.md"]) == _reference(publish, other_server, DOC)
+
+
+def test_entry_is_dropped_once_the_file_changes(
+    publish, interrupted, server, other_server, tmp_path
+):
+    interrupted({"doc.md": DOC})
+    edited = DOC.replace("Paragraph 0.", "Paragraph zero.")
+
+    pages = publish({"doc.md": edited})
+    assert _content(server, pages["doc.md"]) == _reference(
+        publish, other_server, edited
+    )
+    assert not (tmp_path / "docs" / ".notionpub" / "journal").exists()
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = Journal.load(path)
+    journal.begin("doc.md", "hash", "page")
+    journal.confirm("doc.md", 100, "block100")
+    journal.close()
+    with open(path, "a") as f:
+        f.write('{"path": "doc.md", "hash": "hash", "page_id": "page", "blo')
+
+    journal = Journal.load(path)
+    assert journal.get("doc.md", "hash")["blocks"] == 100
+    journal.confirm("doc.md", 200, "block200")
+    journal.close()
+    # the next write compacts the journal, dropping the torn line
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert [r["blocks"] for r in records] == [200]
+    assert Journal.load(path).get("doc.md", "other hash") is None
+
+
+def _reference(publish, server, doc):
+    """the content of `doc` when published in one go"""
+    page_id = publish({"doc.md": doc}, name="reference", fake=server)["doc.md"]
+    return _content(server, page_id)
+
+
+def _content(server, page_id):
+    return server.notion.content(page_id)
+
+
+def _paragraph(text):
+    return {
+        "type": "paragraph",
+        "paragraph": {"rich_text": [{"type": "text", "text": {"content": text}}]},
+    }
+
+
+def _entries(tmp_path):
+    return Journal.load(str(tmp_path / "docs" / ".notionpub" / "journal"))._entries
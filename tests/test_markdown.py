@@ -0,0 +1,26 @@
+import json
+import pathlib
+
+import pytest
+from notion.markdown import markdown_to_notion, notion_to_markdown
+
+# inputs, with the outputs (or exceptions) of notion-py's converters from
+# before they were rewritten to run in linear time
+CASES = json.loads(
+    (pathlib.Path(__file__).parent / "data" / "markdown.json").read_text()
+)
+
+
+@pytest.mark.parametrize(
+    "converter", [markdown_to_notion, notion_to_markdown], ids=lambda c: c.__name__
+)
+def test_converter_matches_previous_implementation(converter):
+    mismatches = []
+    for case in CASES[converter.__name__]:
+        try:
+            result = {"output": converter(case["input"])}
+        except Exception as e:
+            result = {"error": type(e).__name__}
+        if result != {k: v for k, v in case.items() if k != "input"}:
+            mismatches.append((case, result))
+    assert mismatches == []
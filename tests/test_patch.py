@@ -0,0 +1,98 @@
+import pytest
+
+DOC = """# Title
+
+First paragraph.
+
+Second paragraph, with **bold** text.
+
+- one
+- two
+  - two point one
+  - two point two
+- three
+
+1. first
+2. second
+
+Last paragraph.
+"""
+
+EDITS = {
+    "insert at top": lambda doc: "Above the title.\n\n" + doc,
+    "insert in middle": lambda doc: doc.replace(
+        "Second paragraph", "An inserted paragraph.\n\nSecond paragraph"
+    ),
+    "append at end": lambda doc: doc + "\nA new last paragraph.\n",
+    "delete": lambda doc: doc.replace("First paragraph.\n\n", ""),
+    "change type": lambda doc: doc.replace("First paragraph.", "## First heading"),
+    "change text": lambda doc: doc.replace("with **bold** text", "with new text"),
+    "change and insert after": lambda doc: doc.replace(
+        "with **bold** text.", "changed.\n\nInserted after it."
+    ),
+    "change nested item": lambda doc: doc.replace("two point one", "two point 1"),
+    "add nested item": lambda doc: doc.replace(
+        "- three", "  - two point three\n- three"
+    ),
+    "remove nested items": lambda doc: doc.replace(
+        "  - two point one\n  - two point two\n", ""
+    ),
+    "nest a list item": lambda doc: doc.replace("- three", "  - three"),
+}
+
+
+@pytest.mark.parametrize("edit", EDITS)
+def test_patched_page_matches_fresh_publish(publish, server, other_server, edit):
+    page_id = publish({"doc.md": DOC})["doc.md"]
+    before = server.notion.descendants(page_id)
+
+    edited = EDITS[edit](DOC)
+    assert publish({"doc.md": edited})["doc.md"] == page_id
+    fresh_id = publish({"doc.md": edited}, name="fresh", fake=other_server)["doc.md"]
+
+    assert server.notion.content(page_id) == other_server.notion.content(fresh_id)
+    kept = before & server.notion.descendants(page_id)
+    if edit == "insert at top":
+        # blocks can only be inserted after another, so the page is re-appended
+        assert not kept
+    else:
+        assert len(kept) >= len(before) // 2
+
+
+def test_unchanged_page_is_not_written(publish, server):
+    page_id = publish({"doc.md": DOC})["doc.md"]
+    before = server.notion.descendants(page_id)
+    written = _writes(server)
+
+    publish({"doc.md": DOC}, force=True)
+
+    assert server.notion.descendants(page_id) == before
+    assert _writes(server) == written
+
+
+def _writes(server):
+    requests = server.stats.as_dict()["requests_by_endpoint"]
+    return {
+        endpoint: count
+        for endpoint, count in requests.items()
+        if endpoint not in ("pages.retrieve", "blocks.children.list")
+    }
+
+
+def test_unchanged_children_are_not_listed(publish, server):
+    doc = "".join("- item {}\n  - nested {}\n".format(i, i) for i in range(200))
+    publish({"doc.md": doc})
+    before = server.stats.as_dict()["requests_by_endpoint"]
+
+    publish({"doc.md": doc.replace("item 100", "item one hundred")})
+
+    after = server.stats.as_dict()["requests_by_endpoint"]
+    requests = {
+        k: v - before.get(k, 0) for k, v in after.items() if v > before.get(k, 0)
+    }
+    # the root's child pages, and the page's two pages of children
+    assert requests == {
+        "pages.retrieve": 1,
+        "blocks.children.list": 3,
+        "blocks.update": 1,
+    }
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+from notion_client import APIResponseError
+
+from fake_notion import FakeNotionServer
+from notionpub import notion
+from notionpub.ratelimit import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def fake_server():
+    """a function that starts a FakeNotionServer with the given options"""
+    servers = []
+
+    def start(**options):
+        servers.append(FakeNotionServer(**options).start())
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def test_burst_then_rate(clock):
+    bucket = TokenBucket(rate=2, burst=3, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.now == 0
+    for _ in range(4):
+        bucket.acquire()
+    assert clock.now == pytest.approx(2.0)
+
+
+def test_bucket_refills_up_to_burst(clock):
+    bucket = TokenBucket(rate=2, burst=3, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        bucket.acquire()
+    clock.sleep(60)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.now == 60
+    bucket.acquire()
+    assert clock.now == pytest.approx(60.5)
+
+
+def test_pause_holds_back_every_caller(clock):
+    bucket = TokenBucket(rate=1, burst=10, clock=clock, sleep=clock.sleep)
+    bucket.pause(5)
+    # a shorter pause doesn't cut a longer one short
+    bucket.pause(1)
+    bucket.acquire()
+    # and the bucket refills from empty once it is over
+    assert clock.now == pytest.approx(6)
+    bucket.acquire()
+    assert clock.now == pytest.approx(7)
+
+
+def test_pause_holds_back_callers_on_every_thread():
+    bucket = TokenBucket(rate=1000, burst=1000)
+    bucket.pause(0.2)
+    start = time.monotonic()
+    waited = []
+
+    def acquire():
+        bucket.acquire()
+        waited.append(time.monotonic() - start)
+
+    threads = [threading.Thread(target=acquire) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(waited) == 3
+    assert min(waited) >= 0.2
+
+
+def test_rate_limited_request_is_retried(fake_server, clock):
+    server = fake_server(rate_limit_every=2, retry_after=3)
+    bucket = TokenBucket(rate=1, burst=10, clock=clock, sleep=clock.sleep)
+    client = notion.NotionClient("secret_test", bucket, base_url=server.url)
+
+    client.get_page(server.root_page_id)
+    assert client.get_page(server.root_page_id)["id"] == server.root_page_id
+    stats = server.stats.as_dict()
+    assert stats["requests"] == 3
+    assert stats["rate_limited"] == 1
+    # the retry waited for the Retry-After the server asked for
+    assert clock.now >= 3
+
+
+def test_retries_stop_after_max_retries(fake_server):
+    server = fake_server(rate_limit_every=1, retry_after=0)
+    client = notion.NotionClient(
+        "secret_test", TokenBucket(rate=1000, burst=1000), base_url=server.url
+    )
+
+    with pytest.raises(APIResponseError) as e:
+        client.get_page(server.root_page_id)
+    assert e.value.status == 429
+    assert server.stats.as_dict()["requests"] == notion.MAX_RETRIES + 1
@@ -0,0 +1,20 @@
+import pytest
+
+import bench_startup
+
+
+@pytest.fixture(scope="module")
+def directory(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("startup")
+    bench_startup.generate_tree(directory, 20)
+    return str(directory)
+
+
+@pytest.mark.parametrize("scenario", bench_startup.SCENARIOS)
+def test_cold_start(directory, scenario):
+    cmd = bench_startup.command(scenario, directory)
+
+    _, modules, _ = bench_startup.import_times(cmd)
+    lazy = [m for m in modules if m.split(".")[0] in bench_startup.LAZY_MODULES]
+    assert lazy == []
+    assert bench_startup.wall_time(cmd, repeat=3) <= bench_startup.BUDGET
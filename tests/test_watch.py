@@ -0,0 +1,40 @@
+import pytest
+
+from notionpub import config, main, notion, watch
+from notionpub.ratelimit import TokenBucket
+
+
+@pytest.mark.parametrize(
+    "delete, archived", [(["a.md"], {"a.md"}), (["a.md", "b.md"], set())]
+)
+def test_deleted_files_are_archived_unless_none_are_left(
+    publish, server, tmp_path, monkeypatch, delete, archived
+):
+    pages = publish({"a.md": "# A\n", "b.md": "# B\n"})
+    directory = tmp_path / "docs"
+
+    # the watcher's polls delete the files, then stop watching
+    steps = iter([lambda: [(directory / relpath).unlink() for relpath in delete]])
+
+    def sleep(seconds):
+        step = next(steps, None)
+        if step is None:
+            raise KeyboardInterrupt
+        step()
+
+    watcher = watch.Watcher
+    monkeypatch.setattr(
+        watch, "Watcher", lambda *args, **kwargs: watcher(*args, sleep=sleep, **kwargs)
+    )
+    with open(directory / "notionpub.yaml") as f:
+        cfg = config.load_config(f)
+    client = notion.NotionClient(
+        "secret_test", TokenBucket(rate=1000, burst=1000), base_url=server.url
+    )
+    main._watch(directory, cfg, parse_workers=1, interval=0, debounce=0, client=client)
+
+    assert {
+        relpath
+        for relpath, page_id in pages.items()
+        if server.notion.blocks[page_id]["archived"]
+    } == archived